@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+"""
+Offline solvability check for the smb1.py stages
+
+Usage:
+  python analyze.py              - every stage in LEVEL_DATA, one process per core
+  python analyze.py 1-1 8-4      - only the named stages
+  python analyze.py --jobs 1     - in this process, one stage after another
+
+Each stage is searched from the spawn point by stepping the real
+Player.update with every combination of left/none/right and jump held or
+released (run always held), until the player reaches the flagpole, or the
+castle in a castle stage. States are memoized by a quantized hash of what
+the physics reads, so an arc reached twice is expanded once. Enemies and
+the scroll lock are ignored, and the player stays small: this answers
+whether the terrain allows a route, not whether the route is easy. Exits
+1 if any stage is unreachable.
+"""
+
+import os
+import sys
+import time
+import heapq
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+
+os.environ.setdefault("SMB1_HEADLESS", "1")
+
+import smb1
+
+Buttons = smb1.Buttons
+ACTIONS = [horizontal | Buttons.RUN | jump
+           for horizontal in (Buttons.RIGHT, 0, Buttons.LEFT)
+           for jump in (Buttons.JUMP, 0)]
+MAX_STATES = 1_000_000  # per stage; the verdict is "unknown" past this
+
+class TerrainLevel(smb1.Level):
+    """A Level the search can share across branches: bumps change nothing.
+    
+    A small player never breaks bricks and a used block stays solid, so
+    skipping bumps leaves every collision exactly as the game has it.
+    """
+    def bump_tile(self, col, row, player):
+        pass
+
+def load_state(player, state):
+    player.dead = False  # set by the last branch that fell in a pit
+    (player.x, player.y, player.vx, player.vy,
+     player.on_ground, player.jumping, player.jump_held, player.jump_timer) = state
+
+def save_state(player):
+    return (player.x, player.y, player.vx, player.vy,
+            player.on_ground, player.jumping, player.jump_held, player.jump_timer)
+
+def state_key(player):
+    """The fields Player.update reads, quantized and packed into one int.
+    
+    Positions to the pixel, vx to 1/8 and vy to 1/4 px per frame. The jump
+    timer (0 to Phys.JUMP_FRAMES, 5 bits) and held flag only matter mid-jump
+    with the button still down.
+    An int keeps the seen set far smaller than tuple keys would.
+    """
+    rising = player.jumping and player.jump_held
+    return (int(player.x) << 33 | (int(player.y) + 512) << 22 | (round(player.vx * 8) + 64) << 15
+            | (round(player.vy * 4) + 64) << 8 | player.on_ground << 7 | player.jumping << 6
+            | ((player.jump_timer if rising else 0) & 0x1F) << 1 | rising)
+
+def goal_x(level):
+    """The x the player must reach, as Game.update checks it, or None."""
+    if level.flagpole_x > 0: return level.flagpole_x - 8
+    if level.castle and level.castle_x > 0: return level.castle_x - 8
+    return None
+
+def analyze_stage(stage_id):
+    """Search one stage; returns a dict with the verdict and search stats."""
+    world, stage = stage_id
+    start = time.perf_counter()
+    level = TerrainLevel(world, stage, smb1.level_blob(world, stage))
+    player = smb1.Player(32, smb1.NES_H - 64)
+    goal = goal_x(level)
+    seen = {state_key(player)}
+    # Best-first on x: solvable stages finish without exhausting the space
+    frontier = [(-player.x, 0, save_state(player))]
+    furthest, order, reached = player.x, 1, False
+    while frontier and goal is not None and len(seen) < MAX_STATES:
+        _, _, state = heapq.heappop(frontier)
+        for buttons in ACTIONS:
+            load_state(player, state)
+            player.update(buttons, level)
+            if player.dead: continue
+            key = state_key(player)
+            if key in seen: continue
+            seen.add(key)
+            furthest = max(furthest, player.x)
+            if player.x >= goal:
+                reached = True
+                break
+            heapq.heappush(frontier, (-player.x, order, save_state(player)))
+            order += 1
+        if reached: break
+    if goal is None: verdict = "no goal"
+    elif reached: verdict = "yes"
+    elif frontier: verdict = "unknown"
+    else: verdict = "no"
+    return {"stage": f"{world}-{stage}", "goal": goal, "reached": verdict, "furthest": int(furthest),
+            "states": len(seen), "seconds": round(time.perf_counter() - start, 2)}
+
+def parse_stage(text):
+    world, _, stage = text.partition("-")
+    key = (int(world), int(stage))
+    if key not in smb1.LEVEL_DATA:
+        raise argparse.ArgumentTypeError(f"no stage {text}")
+    return key
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check every stage can be finished with the game's own physics.")
+    parser.add_argument("stages", nargs="*", type=parse_stage, metavar="W-S", help="stages to check (default: all)")
+    parser.add_argument("--jobs", type=int, default=os.cpu_count(), help="worker processes (default: one per core)")
+    args = parser.parse_args()
+    stages = args.stages or sorted(smb1.LEVEL_DATA)
+    start = time.perf_counter()
+    print(f"{'stage':>6} {'goal x':>7} {'reached':>8} {'furthest':>9} {'states':>9} {'seconds':>8}")
+    if args.jobs > 1:
+        with ProcessPoolExecutor(args.jobs) as pool:
+            results = list(pool.map(analyze_stage, stages))
+    else:
+        results = map(analyze_stage, stages)
+    failed = []
+    for result in results:
+        print(f"{result['stage']:>6} {result['goal'] or '-':>7} {result['reached']:>8} {result['furthest']:>9} "
+              f"{result['states']:>9} {result['seconds']:>8.2f}")
+        if result["reached"] != "yes": failed.append(result["stage"])
+    print(f"{len(stages) - len(failed)}/{len(stages)} reachable in {time.perf_counter() - start:.1f}s"
+          + (f"; check {' '.join(failed)}" if failed else ""))
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,440 @@
+#!/usr/bin/env python3
+"""
+Benchmarks for smb1.py
+
+Usage:
+  python bench.py memory    - per-level memory footprint of Level construction
+  python bench.py draw      - draw calls and time per frame, sprite atlas off vs on
+  python bench.py stages    - fps, allocation and peak RSS per stage, checked against the baseline
+  python bench.py baseline  - rerun the stage suite and store it as the new baseline
+  python bench.py collision - tile tests per frame, swept Level.move vs the nearby-rects path
+  python bench.py particles - update/draw cost at 1k and 10k particles, objects vs ParticlePool
+  python bench.py scalers   - present cost per scaler at SCALE 2-6: full, static idle, static blink
+  python bench.py endless   - peak RSS and ms per frame streaming 100k endless columns
+  python bench.py startup   - cold-cache effect rendering on 1, 2, 4 and 8 worker processes
+  python bench.py music     - resident music PCM and synthesis cost, full loops vs the sequencer
+"""
+
+import os
+import sys
+import gc
+import json
+import time
+import shutil
+import tempfile
+import tracemalloc
+
+os.environ.setdefault("SMB1_HEADLESS", "1")
+
+import smb1
+
+def level_footprint(world, stage):
+    """Bytes and Python objects retained by one constructed Level."""
+    blob = smb1.level_blob(world, stage)
+    gc.collect()
+    objects = len(gc.get_objects())
+    tracemalloc.start()
+    level = smb1.Level(world, stage, blob)
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    objects = len(gc.get_objects()) - objects
+    del level
+    return size, objects
+
+def bench_memory():
+    total_size = total_objects = 0
+    print(f"{'level':>6} {'bytes':>10} {'objects':>8}")
+    for world, stage in sorted(smb1.LEVEL_DATA):
+        size, objects = level_footprint(world, stage)
+        total_size += size
+        total_objects += objects
+        print(f"{world}-{stage:<4} {size:>10} {objects:>8}")
+    n = len(smb1.LEVEL_DATA)
+    print(f"{'mean':>6} {total_size // n:>10} {total_objects // n:>8}")
+
+def draw_frames(frames=600):
+    """Mean (primitives, blits, ms) per frame scrolling through every level."""
+    surf = smb1.pygame.Surface((smb1.NES_W, smb1.NES_H))
+    counter = smb1.DRAW_COUNTER
+    counter.install()
+    primitives = blits = elapsed = 0
+    for world, stage in sorted(smb1.LEVEL_DATA):
+        level = smb1.Level(world, stage, smb1.level_blob(world, stage))
+        player = smb1.Player(32, smb1.NES_H - 64)
+        counter.end_frame()
+        for frame in range(frames):
+            level.update(None)
+            level.camera = min(frame * 2.0, level.width * smb1.T - smb1.NES_W)
+            player.x = level.camera + 80
+            start = time.perf_counter()
+            level.draw(surf, frame)
+            player.draw(surf, level.camera, frame)
+            elapsed += time.perf_counter() - start
+            p, b = counter.end_frame()
+            primitives += p
+            blits += b
+    n = frames * len(smb1.LEVEL_DATA)
+    return primitives / n, blits / n, elapsed / n * 1000
+
+def bench_draw():
+    print(f"{'atlas':>6} {'primitives':>11} {'blits':>7} {'ms/frame':>9}")
+    for cached in (False, True):
+        smb1.SPRITE_CACHE = cached
+        primitives, blits, ms = draw_frames()
+        print(f"{'on' if cached else 'off':>6} {primitives:>11.1f} {blits:>7.1f} {ms:>9.3f}")
+
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bench_baseline.json")
+STAGE_FRAMES = 600
+FPS_REPEATS = 5  # fps is taken from the fastest run to damp scheduler noise
+# Allowed drift before a stage counts as a regression
+FPS_TOLERANCE = 0.65    # fps may fall to 65% of the baseline
+ALLOC_TOLERANCE = 1.25  # bytes allocated per frame may grow by 25%
+RSS_TOLERANCE = 1.25
+
+def reset_peak_rss():
+    """Reset the kernel's RSS high-water mark so each stage reports its own peak."""
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+    except OSError:
+        pass
+
+def peak_rss():
+    """Peak resident set size in KB (VmHWM on Linux, ru_maxrss elsewhere)."""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    import resource
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss // 1024 if sys.platform == "darwin" else rss
+
+def play_stage(world, stage, frames, step=None):
+    """Drive a full Game.update/draw cycle on one stage under the hold right + jump bot.
+    
+    Dying or finishing restarts the same stage so every frame is spent on it.
+    step(frame) wraps each frame when given.
+    """
+    game = smb1.Game(smb1.autorun_input())
+    game.world, game.stage = world, stage
+    game.start_level()
+    for frame in range(frames):
+        if (game.world, game.stage) != (world, stage) or game.state == smb1.GameState.GAME_OVER:
+            game.world, game.stage, game.lives = world, stage, 3
+            game.start_level()
+        if step: step(frame)
+        game.update()
+        game.draw()
+        if step: step(None)
+    return game
+
+def stage_stats(world, stage, frames=STAGE_FRAMES):
+    """fps, bytes allocated per frame and peak RSS (KB) for one stage."""
+    gc.collect()
+    reset_peak_rss()
+    best = float("inf")
+    for _ in range(FPS_REPEATS):
+        start = time.perf_counter()
+        play_stage(world, stage, frames)
+        best = min(best, time.perf_counter() - start)
+    fps = frames / best
+    rss = peak_rss()
+    # Second pass under tracemalloc: the per-frame peak above the frame's
+    # starting usage is what that frame allocated, freed or not.
+    base = [0]
+    alloc = [0]
+    def step(frame):
+        if frame is not None:
+            tracemalloc.reset_peak()
+            base[0] = tracemalloc.get_traced_memory()[0]
+        else:
+            alloc[0] += tracemalloc.get_traced_memory()[1] - base[0]
+    tracemalloc.start()
+    play_stage(world, stage, frames, step)
+    tracemalloc.stop()
+    return {"fps": round(fps, 1), "alloc_per_frame": alloc[0] // frames, "peak_rss_kb": rss}
+
+def run_stages():
+    results = {}
+    for world, stage in sorted(smb1.LEVEL_DATA):
+        results[f"{world}-{stage}"] = stage_stats(world, stage)
+    return results
+
+def regressions(name, stats, base):
+    """Human-readable list of metrics that drifted past tolerance."""
+    problems = []
+    if stats["fps"] < base["fps"] * FPS_TOLERANCE:
+        problems.append(f"fps {base['fps']} -> {stats['fps']}")
+    if stats["alloc_per_frame"] > base["alloc_per_frame"] * ALLOC_TOLERANCE:
+        problems.append(f"alloc/frame {base['alloc_per_frame']} -> {stats['alloc_per_frame']}")
+    if stats["peak_rss_kb"] > base["peak_rss_kb"] * RSS_TOLERANCE:
+        problems.append(f"peak RSS {base['peak_rss_kb']} -> {stats['peak_rss_kb']} KB")
+    return [f"{name}: {p}" for p in problems]
+
+def bench_stages():
+    try:
+        with open(BASELINE) as f:
+            baseline = json.load(f)["stages"]
+    except FileNotFoundError:
+        baseline = {}
+    print(f"{'level':>6} {'fps':>8} {'base':>8} {'alloc/frame':>12} {'base':>8} {'rss KB':>8} {'base':>8}")
+    problems = []
+    for name, stats in run_stages().items():
+        base = baseline.get(name)
+        if base: problems += regressions(name, stats, base)
+        base = base or {"fps": "-", "alloc_per_frame": "-", "peak_rss_kb": "-"}
+        print(f"{name:>6} {stats['fps']:>8} {base['fps']:>8} {stats['alloc_per_frame']:>12} {base['alloc_per_frame']:>8} "
+              f"{stats['peak_rss_kb']:>8} {base['peak_rss_kb']:>8}")
+    if not baseline:
+        print(f"no baseline at {BASELINE}; run 'python bench.py baseline'")
+    for problem in problems:
+        print("REGRESSION", problem)
+    if problems:
+        sys.exit(1)
+
+def bench_baseline():
+    results = run_stages()
+    with open(BASELINE, "w") as f:
+        json.dump({"frames": STAGE_FRAMES, "python": sys.version.split()[0], "stages": results}, f, indent=1)
+        f.write("\n")
+    print(f"wrote {len(results)} stages to {BASELINE}")
+
+def record_moves(frames=STAGE_FRAMES):
+    """Every Level.move call made while playing each stage: [(level, args)], frames."""
+    calls = []
+    move = smb1.Level.move
+    def recording(level, *args):
+        calls.append((level, args))
+        return move(level, *args)
+    smb1.Level.move = recording
+    try:
+        for world, stage in sorted(smb1.LEVEL_DATA):
+            play_stage(world, stage, frames)
+    finally:
+        smb1.Level.move = move
+    return calls, frames * len(smb1.LEVEL_DATA)
+
+def nearby_path(level, x, y, w, h, dx, dy):
+    """The pre-sweep path: move, then test every nearby solid rect. Returns tests made."""
+    rect = smb1.pygame.Rect(int(x + dx), int(y + dy), w, h)
+    tiles = level.get_nearby_solids(x + dx, y + dy)
+    for tile in tiles:
+        rect.colliderect(tile)
+    return len(tiles)
+
+def bench_collision():
+    calls, frames = record_moves()
+    print(f"{len(calls)} moves over {frames} frames ({len(calls) / frames:.1f} per frame)")
+    print(f"{'path':>8} {'tests/frame':>12} {'us/frame':>9}")
+    start = time.perf_counter()
+    tests = sum(nearby_path(level, *args) for level, args in calls)
+    elapsed = time.perf_counter() - start
+    print(f"{'nearby':>8} {tests / frames:>12.1f} {elapsed / frames * 1e6:>9.2f}")
+    levels = {id(level): level for level, _ in calls}.values()
+    for level in levels: level.cell_tests = 0
+    start = time.perf_counter()
+    for level, args in calls:
+        level.move(*args)
+    elapsed = time.perf_counter() - start
+    tests = sum(level.cell_tests for level in levels)
+    print(f"{'swept':>8} {tests / frames:>12.1f} {elapsed / frames * 1e6:>9.2f}")
+
+class ObjectParticle:
+    """One dict-backed object per particle, the layout ParticlePool replaced."""
+    def __init__(self, x, y, vx, vy):
+        self.x, self.y, self.vx, self.vy = x, y, vx, vy
+        self.alive = True
+    
+    def update(self):
+        self.vy += smb1.ParticlePool.GRAVITY
+        self.x += self.vx
+        self.y += self.vy
+        if self.y > smb1.NES_H + 32: self.alive = False
+    
+    def draw(self, surf, cam):
+        smb1.pygame.draw.rect(surf, smb1.Pal.BRICK, (int(self.x - cam), int(self.y), 8, 8))
+
+class ObjectList(list):
+    def spawn(self, *args): self.append(ObjectParticle(*args))
+    def update(self):
+        for p in self[:]:
+            p.update()
+            if not p.alive: self.remove(p)
+    def draw(self, surf, cam):
+        for p in self: p.draw(surf, cam)
+
+def particle_frames(pool, count, frames=60):
+    """ms per update and per draw for count particles bursting over the screen."""
+    surf = smb1.pygame.Surface((smb1.NES_W, smb1.NES_H))
+    for i in range(count):
+        # Launched high enough that none land within the run
+        pool.spawn(i % smb1.NES_W, smb1.NES_H, (i % 5 - 2) * 0.5, -10.0 - i % 7)
+    update = draw = 0.0
+    for _ in range(frames):
+        start = time.perf_counter()
+        pool.update()
+        update += time.perf_counter() - start
+        start = time.perf_counter()
+        pool.draw(surf, 0)
+        draw += time.perf_counter() - start
+    assert len(pool) == count
+    return update / frames * 1000, draw / frames * 1000
+
+def bench_particles():
+    layouts = [("objects", ObjectList), ("pool", lambda: smb1.ParticlePool(vectorized=False))]
+    if smb1.np is not None:
+        layouts.append(("pool+np", lambda: smb1.ParticlePool(vectorized=True)))
+    print(f"{'count':>6} {'layout':>8} {'update ms':>10} {'draw ms':>8}")
+    for count in (1000, 10000):
+        for name, make in layouts:
+            update, draw = particle_frames(make(), count)
+            print(f"{count:>6} {name:>8} {update:>10.3f} {draw:>8.3f}")
+
+def present_ms(scaler, frames, static, change=None, repeats=100):
+    """Mean ms per Scaler.present over repeats, cycling through frames."""
+    scaler.bands = None
+    scaler.present(frames[0], static)
+    start = time.perf_counter()
+    for i in range(repeats):
+        frame = frames[i % len(frames)]
+        if change: change(frame, i)
+        scaler.present(frame, static)
+    return (time.perf_counter() - start) / repeats * 1000
+
+def bench_scalers():
+    # Under the dummy video driver flip is nearly free and "hardware" stretches
+    # in software, so this measures the CPU side of each path only.
+    level = smb1.Level(1, 1, smb1.level_blob(1, 1))
+    frames = []
+    for i in range(8):
+        level.camera = i * 24.0
+        surf = smb1.pygame.Surface((smb1.NES_W, smb1.NES_H))
+        level.draw(surf, i)
+        frames.append(surf)
+    def blink(surf, i):
+        # One text line toggling, like the title's PRESS ENTER
+        surf.fill(smb1.Pal.WHITE if i % 2 else smb1.Pal.SKY, (64, 150, 128, 8))
+    print(f"{'scale':>5} {'scaler':>9} {'full ms':>8} {'idle ms':>8} {'blink ms':>9}")
+    for scale in range(2, 7):
+        for mode in smb1.SCALERS:
+            if mode == "integer" and smb1.np is None: continue
+            if mode == "hardware" and scale != 2: continue  # window size is fixed by SDL
+            scaler = smb1.Scaler(mode, scale)
+            scaler.open()
+            full = present_ms(scaler, frames, False)
+            idle = present_ms(scaler, frames[:1], True)
+            blinking = present_ms(scaler, frames[:1], True, blink)
+            print(f"{scale if mode != 'hardware' else '-':>5} {mode:>9} {full:>8.3f} {idle:>8.3f} {blinking:>9.3f}")
+
+ENDLESS_COLUMNS = 100_000
+ENDLESS_REPORT = 10_000
+
+def bench_endless(columns=ENDLESS_COLUMNS, report=ENDLESS_REPORT):
+    """Scroll an EndlessLevel one column per frame, updating and drawing it.
+    
+    Peak RSS is reset every report columns, so a flat column means memory
+    does not grow with distance; the window counts show why.
+    """
+    level = smb1.EndlessLevel()
+    surf = smb1.pygame.Surface((smb1.NES_W, smb1.NES_H))
+    print(f"{'columns':>8} {'peak KB':>8} {'ms/frame':>9} {'window':>7} {'blocks':>7} {'chunks':>7} "
+          f"{'dormant':>8} {'items':>6}")
+    reset_peak_rss()
+    start = time.perf_counter()
+    for frame in range(1, columns + 1):
+        level.camera += smb1.T
+        level.update(None)
+        level.draw(surf, frame)
+        if frame % report == 0:
+            ms = (time.perf_counter() - start) * 1000 / report
+            print(f"{frame:>8} {peak_rss():>8} {ms:>9.3f} {level.cols - level.first:>7} {len(level.blocks):>7} "
+                  f"{len(level.chunks):>7} {len(level.spawns):>8} {len(level.items):>6}")
+            reset_peak_rss()
+            start = time.perf_counter()
+
+STARTUP_JOBS = (1, 2, 4, 8)
+STARTUP_REPEATS = 3
+
+def cold_startup(jobs):
+    """ms until init_sounds returns, from an empty cache."""
+    cache = smb1.CACHE_DIR = tempfile.mkdtemp(prefix="smb1-bench-")
+    try:
+        start = time.perf_counter()
+        smb1.init_sounds(jobs)
+        return (time.perf_counter() - start) * 1000
+    finally:
+        shutil.rmtree(cache)
+
+def init_mixer():
+    if not smb1.pygame.mixer.get_init():
+        os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+        smb1.pygame.mixer.init(smb1.SAMPLE_RATE, -16, 2, 512)
+
+def backends():
+    """Yield each synthesis backend's name with smb1 switched over to it."""
+    numpy = smb1.np
+    try:
+        for backend in (["numpy"] if numpy is not None else []) + ["scalar"]:
+            smb1.np = numpy if backend == "numpy" else None
+            yield backend
+    finally:
+        smb1.np = numpy
+
+def bench_startup():
+    init_mixer()
+    cache = smb1.CACHE_DIR
+    print(f"{os.cpu_count()} cores")
+    print(f"{'backend':>8} {'jobs':>5} {'ready ms':>9}")
+    try:
+        for backend in backends():
+            for jobs in STARTUP_JOBS:
+                ready = min(cold_startup(jobs) for _ in range(STARTUP_REPEATS))
+                print(f"{backend:>8} {jobs:>5} {ready:>9.0f}")
+    finally:
+        smb1.CACHE_DIR = cache
+
+MUSIC_CHUNKS = 50
+
+def bench_music():
+    """Per track: bytes a full pre-rendered loop held vs the sequencer's two
+    queued chunks, and synthesis time per chunk as a share of its play time."""
+    smb1.init_music()
+    resident = 2 * smb1.SEQ_CHUNK * 4
+    chunk_ms = smb1.SEQ_CHUNK * 1000 / smb1.SAMPLE_RATE
+    for backend in backends():
+        print(f"{backend}: {resident} bytes resident per track, {chunk_ms:.0f} ms per chunk")
+        print(f"{'track':>16} {'loop bytes':>11} {'ms/chunk':>9} {'cpu %':>6}")
+        total = 0
+        for name, track in smb1.MUSIC_DEFS.items():
+            loop = int(smb1.SAMPLE_RATE * track[3]) * 4
+            total += loop
+            sequencer = smb1.Sequencer()
+            sequencer.track, sequencer.loops = track, -1
+            start = time.perf_counter()
+            for _ in range(MUSIC_CHUNKS): sequencer.next_chunk()
+            ms = (time.perf_counter() - start) * 1000 / MUSIC_CHUNKS
+            print(f"{name:>16} {loop:>11} {ms:>9.3f} {ms * 100 / chunk_ms:>6.1f}")
+        print(f"{'all loops':>16} {total:>11}")
+
+BENCHES = {
+    "memory": bench_memory,
+    "draw": bench_draw,
+    "stages": bench_stages,
+    "baseline": bench_baseline,
+    "collision": bench_collision,
+    "particles": bench_particles,
+    "scalers": bench_scalers,
+    "endless": bench_endless,
+    "startup": bench_startup,
+    "music": bench_music,
+}
+
+if __name__ == "__main__":
+    names = sys.argv[1:] or list(BENCHES)
+    for name in names:
+        if name not in BENCHES:
+            sys.exit(f"unknown benchmark {name!r}; choose from {', '.join(BENCHES)}")
+        BENCHES[name]()
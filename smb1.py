@@ -1,4 +1,4 @@
-" #!/usr/bin/env python3
+#!/usr/bin/env python3
 """
 Cat's Ultra Mario 2D Bros! v1.1
 Complete NES-Exact SMB1 Engine (Single File)
@@ -12,13 +12,40 @@ Controls:
   Enter - Start/Pause
 """
 
+import os
+import re
+import sys
+import time
 import pygame
 import math
 import array
 import random
-
-pygame.init()
-pygame.mixer.init(22050, -16, 2, 512)
+import mmap
+import types
+import hashlib
+import struct
+import zlib
+import json
+import csv
+from collections import deque
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+try:
+    import numpy as np
+except ImportError:  # fall back to the scalar synthesis and particle paths
+    np = None
+
+# Headless mode (SMB1_HEADLESS=1 or --headless) opens no window, initializes
+# no audio and runs Game without clock.tick, for soak tests and bots.
+HEADLESS = os.environ.get("SMB1_HEADLESS", "0") != "0" or (__name__ == "__main__" and "--headless" in sys.argv)
+
+if HEADLESS:
+    os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+    pygame.font.init()
+else:
+    pygame.init()
+    pygame.mixer.init(22050, -16, 2, 512)
 
 # === NES DISPLAY CONSTANTS ===
 SCALE = 3
@@ -26,12 +53,234 @@ NES_W, NES_H = 256, 240
 W, H = NES_W * SCALE, NES_H * SCALE
 T = 16
 FPS = 60
+STEP = 1 / FPS  # the fixed simulation step, in seconds
+MAX_CATCHUP = 5  # steps simulated per render before game time is dropped
 
-screen = pygame.display.set_mode((W, H))
-pygame.display.set_caption("Cat's Ultra Mario 2D Bros! v1.1")
 nes_surface = pygame.Surface((NES_W, NES_H))
 clock = pygame.time.Clock()
 
+# === INPUT ===
+# Game and Player read a bitmask of pad buttons from an input source: any
+# zero-argument callable. read_keyboard is the default; headless runs plug
+# in scripted sources instead.
+class Buttons:
+    LEFT = 1
+    RIGHT = 2
+    RUN = 4
+    JUMP = 8
+    DOWN = 16
+    START = 32
+
+KEY_BINDINGS = {
+    Buttons.LEFT: (pygame.K_LEFT, pygame.K_a),
+    Buttons.RIGHT: (pygame.K_RIGHT, pygame.K_d),
+    Buttons.RUN: (pygame.K_x, pygame.K_LSHIFT),
+    Buttons.JUMP: (pygame.K_z, pygame.K_SPACE),
+    Buttons.DOWN: (pygame.K_DOWN, pygame.K_s),
+    Buttons.START: (pygame.K_RETURN, pygame.K_ESCAPE),
+}
+
+def read_keyboard():
+    keys = pygame.key.get_pressed()
+    return sum(button for button, bound in KEY_BINDINGS.items() if any(keys[k] for k in bound))
+
+def autorun_input(period=40):
+    """Scripted input: press start, then run right, jumping every period frames."""
+    frame = 0
+    def read():
+        nonlocal frame
+        frame += 1
+        buttons = Buttons.RIGHT | Buttons.RUN
+        if frame % period < period // 2: buttons |= Buttons.JUMP
+        return buttons
+    return read
+
+# === PROFILER ===
+class Profiler:
+    """Per-subsystem frame timings with rolling p50/p99.
+    
+    Sections are bracketed as t = PROFILER.clock() ... t = PROFILER.lap(name, t).
+    F3 toggles the on-screen overlay; --profile FILE dumps every frame.
+    """
+    WINDOW = 240  # frames in the rolling percentiles
+    REFRESH = 15  # frames between overlay redraws
+    
+    clock = staticmethod(time.perf_counter)
+    
+    def __init__(self):
+        self.frame = {}
+        self.rolling = {}
+        self.records = None  # per-frame dicts, kept only when dumping
+        self.counters = {}  # running event totals, e.g. skipped renders
+        self.overlay = False
+        self.overlay_surf = None
+        self.frames = 0
+    
+    def lap(self, name, start):
+        now = time.perf_counter()
+        self.frame[name] = self.frame.get(name, 0.0) + (now - start) * 1000
+        return now
+    
+    def count(self, name, n=1):
+        self.counters[name] = self.counters.get(name, 0) + n
+    
+    def end_frame(self):
+        for name, ms in self.frame.items():
+            if name not in self.rolling: self.rolling[name] = deque(maxlen=self.WINDOW)
+            self.rolling[name].append(ms)
+        if self.records is not None: self.records.append(self.frame)
+        self.frame = {}
+        self.frames += 1
+    
+    @staticmethod
+    def percentiles(values):
+        values = sorted(values)
+        return values[len(values) // 2], values[min(len(values) - 1, int(len(values) * 0.99))]
+    
+    def draw_overlay(self, surf):
+        if self.overlay_surf is None or self.frames % self.REFRESH == 0:
+            font = get_font(20)
+            rows = [f"{'section':<16}{'p50':>7}{'p99':>7}  ms"]
+            for name, values in sorted(self.rolling.items()):
+                p50, p99 = self.percentiles(values)
+                rows.append(f"{name:<16}{p50:>7.2f}{p99:>7.2f}")
+            if DRAW_COUNTER.installed: rows.append("draws %d  blits %d" % DRAW_COUNTER.last_frame)
+            rows += [f"{name:<16}{value:>14}" for name, value in sorted(self.counters.items())]
+            lines = [font.render(row, True, Pal.WHITE) for row in rows]
+            self.overlay_surf = pygame.Surface((max(l.get_width() for l in lines) + 8, 16 * len(lines) + 8), pygame.SRCALPHA)
+            self.overlay_surf.fill((0, 0, 0, 160))
+            for i, line in enumerate(lines):
+                self.overlay_surf.blit(line, (4, 4 + 16 * i))
+        surf.blit(self.overlay_surf, (8, 8))
+    
+    def dump(self, path):
+        """Write per-frame timings as CSV, or JSON with a p50/p99/mean summary."""
+        names = sorted({name for frame in self.records for name in frame})
+        if path.endswith(".csv"):
+            with open(path, "w", newline="") as f:
+                writer = csv.writer(f)
+                writer.writerow(["frame"] + names)
+                for i, frame in enumerate(self.records):
+                    writer.writerow([i] + [f"{frame.get(name, 0.0):.4f}" for name in names])
+            return
+        summary = {}
+        for name in names:
+            values = [frame[name] for frame in self.records if name in frame]
+            p50, p99 = self.percentiles(values)
+            summary[name] = {"p50": p50, "p99": p99, "mean": sum(values) / len(values)}
+        with open(path, "w") as f:
+            json.dump({"sections": names, "summary": summary, "counters": self.counters, "frames": self.records}, f)
+
+PROFILER = Profiler()
+
+# === SCALERS ===
+# How nes_surface reaches the window (--scaler or SMB1_SCALER; by default
+# integer from INTEGER_MIN_SCALE up and scale below it, always scale without
+# NumPy):
+#   scale    - pygame.transform.scale straight into the window surface
+#   integer  - NumPy nearest-neighbour in two passes: columns are widened
+#              into a preallocated row buffer, then each row is written
+#              SCALE times straight into the window's pixels
+#   hardware - pygame.SCALED: a NES-sized window surface that the SDL
+#              renderer stretches on the GPU
+# scale and integer both copy raw pixels, so a source whose format differs
+# from the window's is converted first; nes_surface is converted once when
+# the window opens, so frames normally skip that.
+# Static screens (title, pause, game over) are compared with the last frame
+# presented in tile-row bands; only changed bands are scaled and updated.
+SCALERS = ("scale", "integer", "hardware")
+BAND_H = 16
+# At 2x transform.scale is faster than integer; from 3x up integer is 1.5-3x
+# faster per full frame (bench.py scalers)
+INTEGER_MIN_SCALE = 3
+
+class Scaler:
+    def __init__(self, mode=None, scale=SCALE):
+        if mode is None: mode = "integer" if scale >= INTEGER_MIN_SCALE else "scale"
+        if mode not in SCALERS:
+            raise ValueError(f"unknown scaler {mode!r}; choose from {', '.join(SCALERS)}")
+        if mode == "integer" and np is None: mode = "scale"
+        self.mode = mode
+        self.scale = 1 if mode == "hardware" else scale
+        self.screen = None
+        self.band_rects = [pygame.Rect(0, y, NES_W, min(BAND_H, NES_H - y)) for y in range(0, NES_H, BAND_H)]
+        self.bands = None  # band bytes as last presented, kept only while static
+        self.rows = None  # integer mode: NES rows widened to window width
+    
+    def open(self):
+        """Create the window for this mode and return its surface."""
+        if pygame.display.get_surface() is not None:
+            # SDL cannot turn an existing window into a SCALED one, or back
+            pygame.display.quit()
+            pygame.display.init()
+        if self.mode == "hardware":
+            self.screen = pygame.display.set_mode((NES_W, NES_H), pygame.SCALED)
+        else:
+            self.screen = pygame.display.set_mode((NES_W * self.scale, NES_H * self.scale))
+        pygame.display.set_caption("Cat's Ultra Mario 2D Bros! v1.1")
+        self.bands = None
+        return self.screen
+    
+    def blit_scaled(self, src, dest):
+        """Fill dest with src scaled up by self.scale."""
+        if self.mode == "hardware":
+            dest.blit(src, (0, 0))
+            return
+        if src.get_bitsize() != dest.get_bitsize() or src.get_masks() != dest.get_masks():
+            src = src.convert(dest)  # both paths below copy raw pixels
+        if self.mode == "integer":
+            w, h = src.get_size()
+            scale = self.scale
+            if self.rows is None: self.rows = np.empty((NES_H, NES_W * scale), np.uint32)
+            rows = self.rows[:h, :w * scale]
+            rows.reshape(h, w, scale)[...] = pygame.surfarray.pixels2d(src).T[:, :, None]
+            pixels = pygame.surfarray.pixels2d(dest).T
+            pixels.reshape(h, scale, w * scale)[...] = rows[:, None, :]
+            del pixels  # unlocks dest
+        else:
+            pygame.transform.scale(src, dest.get_size(), dest)
+    
+    def dirty_rects(self, surf):
+        """Rects of surf that changed since the last static present, merged by run."""
+        bands = [pygame.image.tobytes(surf.subsurface(rect), "RGBX") for rect in self.band_rects]
+        previous, self.bands = self.bands, bands
+        rects = []
+        for i, rect in enumerate(self.band_rects):
+            if previous is not None and previous[i] == bands[i]: continue
+            if rects and rects[-1].bottom == rect.top: rects[-1].h += rect.h
+            else: rects.append(rect.copy())
+        return rects
+    
+    def present(self, surf, static=False):
+        """Scale surf onto the window and show it.
+        
+        static frames push only the bands that changed, and nothing at all
+        when none did; anything else is scaled and flipped in full.
+        """
+        t = PROFILER.clock()
+        if static and not PROFILER.overlay:
+            scale, updates = self.scale, []
+            for rect in self.dirty_rects(surf):
+                dest = pygame.Rect(rect.x * scale, rect.y * scale, rect.w * scale, rect.h * scale)
+                self.blit_scaled(surf.subsurface(rect), self.screen.subsurface(dest))
+                updates.append(dest)
+            t = PROFILER.lap("scale", t)
+            if updates: pygame.display.update(updates)
+            PROFILER.lap("flip", t)
+            return
+        self.bands = None
+        self.blit_scaled(surf, self.screen)
+        t = PROFILER.lap("scale", t)
+        if PROFILER.overlay: PROFILER.draw_overlay(self.screen)
+        t = PROFILER.clock()
+        pygame.display.flip()
+        PROFILER.lap("flip", t)
+
+SCALER = Scaler(os.environ.get("SMB1_SCALER") or None)
+if not HEADLESS:
+    SCALER.open()
+    nes_surface = nes_surface.convert()  # it predates the window; match its format
+
 # === NES-EXACT PHYSICS ===
 class Phys:
     # Exact NES SMB1 physics values
@@ -82,17 +331,32 @@ class Pal:
     COIN = (252, 188, 60)
 
 # === SOUND SYSTEM ===
-def make_sound(freq_func, duration, volume=0.3):
-    sample_rate = 22050
-    samples = int(sample_rate * duration)
+SAMPLE_RATE = 22050
+
+def render_sound(freq_func, duration, volume=0.3):
+    """Render an effect to interleaved 16-bit stereo PCM."""
+    if np is not None: return _render_sound_np(freq_func, duration, volume)
+    return _render_sound_scalar(freq_func, duration, volume)
+
+def _render_sound_scalar(freq_func, duration, volume):
+    samples = int(SAMPLE_RATE * duration)
     data = array.array("h")
     for i in range(samples):
-        t = i / sample_rate
+        t = i / SAMPLE_RATE
         val = freq_func(t) if callable(freq_func) else 0
         sample = int(max(-1, min(1, val)) * 32767 * volume)
         data.append(sample)
         data.append(sample)
-    return pygame.mixer.Sound(buffer=data)
+    return data
+
+def sfx_key(freq_func, duration, volume=0.3):
+    return ("sfx", _code_key(freq_func.__code__) if callable(freq_func) else None, duration, volume)
+
+def sfx_pcm(freq_func, duration, volume=0.3):
+    return cached_pcm(sfx_key(freq_func, duration, volume), lambda: render_sound(freq_func, duration, volume))
+
+def make_sound(freq_func, duration, volume=0.3):
+    return pygame.mixer.Sound(buffer=sfx_pcm(freq_func, duration, volume))
 
 def square_wave(t, freq, duty=0.5):
     if freq <= 0: return 0
@@ -104,43 +368,190 @@ def triangle_wave(t, freq):
     return 4.0 * abs(phase - 0.5) - 1.0
 
 def noise(t):
-    n = int(t * 22050) * 1103515245 + 12345
+    n = int(t * SAMPLE_RATE) * 1103515245 + 12345
     return ((n >> 16) & 0x7fff) / 16384.0 - 1.0
 
 def note_freq(note):
     if note == 0: return 0
     return 440.0 * (2.0 ** ((note - 69) / 12.0))
 
+# === NUMPY SYNTHESIS BACKEND ===
+# Mirrors the scalar wave functions above on whole sample spans. Every step
+# keeps the scalar evaluation order (and note frequencies come straight from
+# note_freq) so both backends produce the same PCM.
+def _np_square(phase, duty):
+    return np.where(phase % 1.0 < duty, 1.0, -1.0)
+
+def _np_triangle(phase):
+    return 4.0 * np.abs(phase % 1.0 - 0.5) - 1.0
+
+def _np_noise(t):
+    n = (t * SAMPLE_RATE).astype(np.int64) * 1103515245 + 12345
+    return ((n >> 16) & 0x7fff) / 16384.0 - 1.0
+
+def _np_to_pcm(mono):
+    # Truncating cast matches int() in the scalar path; repeat interleaves L/R
+    return np.repeat(mono.astype(np.int16), 2)
+
+def _render_sound_np(freq_func, duration, volume):
+    samples = int(SAMPLE_RATE * duration)
+    t = np.arange(samples) / SAMPLE_RATE
+    # Effects are arbitrary scalar callables, so only the sample loop is batched
+    if callable(freq_func):
+        val = np.fromiter(map(freq_func, t.tolist()), np.float64, samples)
+    else:
+        val = np.zeros(samples)
+    return _np_to_pcm(np.clip(val, -1, 1) * 32767 * volume)
+
+def _render_music_np(melody, bass, tempo, duty, start, count, t0, song0, scale):
+    beat_dur = 60.0 / tempo
+    t = np.arange(start, start + count) / SAMPLE_RATE
+    beat = (song0 + (t - t0) * scale) / beat_dur
+    m_freq = np.array([note_freq(n) for n in melody], np.float64)
+    b_freq = np.array([note_freq(n) for n in bass], np.float64)
+    mf = m_freq[(beat * 2).astype(np.int64) % len(melody)]
+    bf = b_freq[beat.astype(np.int64) % len(bass)]
+    lead = np.where(mf > 0, _np_square(t * mf, duty) * 0.25, 0.0)
+    bass_v = np.where(bf > 0, _np_triangle(t * bf) * 0.35, 0.0)
+    perc = np.where(beat % 1.0 < 0.03, _np_noise(t) * 0.12, 0.0)
+    mix = np.clip((lead + bass_v + perc) * MUSIC_VOL, -1, 1)
+    return _np_to_pcm(mix * 32767)
+
+# === PCM CACHE ===
+# Rendered effects are stored as raw interleaved PCM under a hash of
+# everything that shapes them: the effect's parameters, its lambda bytecode
+# and the synthesis functions themselves, so editing any of them
+# simply misses the cache. Set SMB1_CACHE_DIR to an empty string to disable.
+CACHE_DIR = os.environ.get("SMB1_CACHE_DIR", os.path.join(
+    os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache"), "smb1"))
+_synth_key = None
+
+def _code_key(code):
+    consts = tuple(_code_key(c) if isinstance(c, types.CodeType) else c for c in code.co_consts)
+    return (code.co_code, code.co_names, consts)
+
+def _synth_fingerprint():
+    global _synth_key
+    if _synth_key is None:
+        funcs = (square_wave, triangle_wave, noise, _render_sound_scalar,
+                 _np_noise, _np_to_pcm, _render_sound_np)
+        _synth_key = tuple(_code_key(f.__code__) for f in funcs)
+    return _synth_key
+
+def cache_path(key, ext):
+    return os.path.join(CACHE_DIR, hashlib.sha1(repr(key).encode()).hexdigest() + ext)
+
+def cached_blob(key, build, ext):
+    """Return bytes for key from the disk cache, building and storing them on a miss."""
+    if not CACHE_DIR: return build()
+    path = cache_path(key, ext)
+    try:
+        with open(path, "rb") as f:
+            return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError):
+        pass
+    blob = build()
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "wb") as f: f.write(blob)
+        os.replace(tmp, path)
+    except OSError:
+        pass
+    return blob
+
+def pcm_key(key):
+    return (SAMPLE_RATE, _synth_fingerprint(), key)
+
+def cached_pcm(key, render):
+    """Return PCM for key from the disk cache, rendering and storing it on a miss."""
+    return cached_blob(pcm_key(key), render, ".pcm")
+
+def pcm_cached(key):
+    return bool(CACHE_DIR) and os.path.exists(cache_path(pcm_key(key), ".pcm"))
+
 SFX = {}
-MUSIC = {}
+MUSIC_DEFS = {}
 MUSIC_VOL = 0.12
 
-def init_sounds():
-    SFX["jump"] = make_sound(lambda t: square_wave(t, 400 + 1200*t, 0.25), 0.15, 0.2)
-    SFX["jump_big"] = make_sound(lambda t: square_wave(t, 300 + 1000*t, 0.25), 0.2, 0.2)
-    SFX["stomp"] = make_sound(lambda t: square_wave(t, 300 - 200*t, 0.5), 0.1, 0.25)
-    SFX["bump"] = make_sound(lambda t: square_wave(t, 200 - 100*t, 0.5), 0.08, 0.2)
-    SFX["break"] = make_sound(lambda t: noise(t) * max(0, 1 - t*5), 0.15, 0.3)
-    SFX["coin"] = make_sound(lambda t: square_wave(t, 1500 if t < 0.05 else 1200, 0.5), 0.12, 0.2)
-    SFX["powerup"] = make_sound(lambda t: square_wave(t, 400 + 600*math.sin(t*40), 0.25), 0.5, 0.2)
-    SFX["sprout"] = make_sound(lambda t: square_wave(t, 600 + 400*t, 0.25), 0.25, 0.2)
-    SFX["fireball"] = make_sound(lambda t: square_wave(t, 800 - 600*t, 0.5), 0.06, 0.15)
-    SFX["kick"] = make_sound(lambda t: square_wave(t, 500 - 300*t, 0.5), 0.08, 0.2)
-    SFX["1up"] = make_sound(lambda t: square_wave(t, 600 + 200*math.sin(t*20), 0.25), 0.5, 0.25)
-    SFX["pipe"] = make_sound(lambda t: square_wave(t, 100 + 50*math.sin(t*10), 0.5), 0.3, 0.2)
-    SFX["die"] = make_sound(lambda t: square_wave(t, 400 - 350*t, 0.25), 0.8, 0.3)
-    SFX["flagpole"] = make_sound(lambda t: square_wave(t, 800 + 400*math.sin(t*15), 0.25), 0.8, 0.2)
-    SFX["warning"] = make_sound(lambda t: square_wave(t, 600, 0.5) if int(t*8)%2==0 else 0, 0.4, 0.2)
-    SFX["firework"] = make_sound(lambda t: noise(t) * max(0, 1 - t*3), 0.3, 0.25)
-
-def make_music(melody, bass, tempo, duration, duty=0.25):
-    sample_rate = 22050
-    samples = int(sample_rate * duration)
+# name -> (waveform of t, duration, volume)
+SFX_DEFS = {
+    "jump": (lambda t: square_wave(t, 400 + 1200*t, 0.25), 0.15, 0.2),
+    "jump_big": (lambda t: square_wave(t, 300 + 1000*t, 0.25), 0.2, 0.2),
+    "stomp": (lambda t: square_wave(t, 300 - 200*t, 0.5), 0.1, 0.25),
+    "bump": (lambda t: square_wave(t, 200 - 100*t, 0.5), 0.08, 0.2),
+    "break": (lambda t: noise(t) * max(0, 1 - t*5), 0.15, 0.3),
+    "coin": (lambda t: square_wave(t, 1500 if t < 0.05 else 1200, 0.5), 0.12, 0.2),
+    "powerup": (lambda t: square_wave(t, 400 + 600*math.sin(t*40), 0.25), 0.5, 0.2),
+    "sprout": (lambda t: square_wave(t, 600 + 400*t, 0.25), 0.25, 0.2),
+    "fireball": (lambda t: square_wave(t, 800 - 600*t, 0.5), 0.06, 0.15),
+    "kick": (lambda t: square_wave(t, 500 - 300*t, 0.5), 0.08, 0.2),
+    "1up": (lambda t: square_wave(t, 600 + 200*math.sin(t*20), 0.25), 0.5, 0.25),
+    "pipe": (lambda t: square_wave(t, 100 + 50*math.sin(t*10), 0.5), 0.3, 0.2),
+    "die": (lambda t: square_wave(t, 400 - 350*t, 0.25), 0.8, 0.3),
+    "flagpole": (lambda t: square_wave(t, 800 + 400*math.sin(t*15), 0.25), 0.8, 0.2),
+    "warning": (lambda t: square_wave(t, 600, 0.5) if int(t*8)%2==0 else 0, 0.4, 0.2),
+    "firework": (lambda t: noise(t) * max(0, 1 - t*3), 0.3, 0.25),
+}
+
+# === STARTUP RENDER POOL ===
+# init_sounds can fan the effects that are not on disk yet out to worker
+# processes and turn the raw PCM they send back into Sounds. By then this
+# module has already opened the window and the mixer, so workers are spawned
+# rather than forked (a fork would copy a process with SDL's threads running)
+# and start with WORKER_ENV, so that importing this module afresh opens
+# neither. Starting a worker that way takes longer than rendering every
+# effect in-process (see bench.py startup), so the pool only runs when
+# SMB1_AUDIO_JOBS asks for more than one job.
+AUDIO_JOBS = int(os.environ.get("SMB1_AUDIO_JOBS") or 1)
+WORKER_ENV = {"SMB1_HEADLESS": "1", "PYGAME_HIDE_SUPPORT_PROMPT": "1"}
+
+def _init_render_worker(cache_dir, numpy):
+    """Match the parent's cache directory and synthesis backend."""
+    global CACHE_DIR, np
+    CACHE_DIR = cache_dir
+    if not numpy: np = None
+
+def _render_sfx(name):
+    return bytes(sfx_pcm(*SFX_DEFS[name]))
+
+def prerender_audio(jobs=AUDIO_JOBS):
+    """Render effect cache misses across jobs processes; returns {name: PCM}."""
+    sfx = [name for name in SFX_DEFS if not pcm_cached(sfx_key(*SFX_DEFS[name]))]
+    if jobs <= 1 or len(sfx) < 2: return {}
+    saved = {key: os.environ.get(key) for key in WORKER_ENV}
+    os.environ.update(WORKER_ENV)  # inherited by each worker as it is spawned
+    try:
+        with ProcessPoolExecutor(min(jobs, len(sfx)), mp_context=multiprocessing.get_context("spawn"),
+                                 initializer=_init_render_worker, initargs=(CACHE_DIR, np is not None)) as pool:
+            return dict(zip(sfx, pool.map(_render_sfx, sfx)))
+    finally:
+        for key, value in saved.items():
+            if value is None: del os.environ[key]
+            else: os.environ[key] = value
+
+def init_sounds(jobs=AUDIO_JOBS):
+    rendered = prerender_audio(jobs)
+    for name, (freq_func, duration, volume) in SFX_DEFS.items():
+        pcm = rendered.get(name)
+        SFX[name] = pygame.mixer.Sound(buffer=pcm) if pcm else make_sound(freq_func, duration, volume)
+
+def render_music(melody, bass, tempo, duty, start, count, t0=0.0, song0=0.0, scale=1.0):
+    """Render count samples of a track from sample start of its loop to
+    interleaved 16-bit stereo PCM.
+    
+    Oscillators run on the loop clock t = sample / SAMPLE_RATE; notes follow
+    song time, which runs scale times as fast from song0 at t0.
+    """
+    if np is not None: return _render_music_np(melody, bass, tempo, duty, start, count, t0, song0, scale)
+    return _render_music_scalar(melody, bass, tempo, duty, start, count, t0, song0, scale)
+
+def _render_music_scalar(melody, bass, tempo, duty, start, count, t0, song0, scale):
     beat_dur = 60.0 / tempo
     data = array.array("h")
-    for i in range(samples):
-        t = i / sample_rate
-        beat = t / beat_dur
+    for i in range(start, start + count):
+        t = i / SAMPLE_RATE
+        beat = (song0 + (t - t0) * scale) / beat_dur
         m_idx = int(beat * 2) % len(melody)
         m_note = melody[m_idx]
         lead = square_wave(t, note_freq(m_note), duty) * 0.25 if m_note else 0
@@ -152,12 +563,13 @@ def make_music(melody, bass, tempo, duration, duty=0.25):
         v = int(sample * 32767)
         data.append(v)
         data.append(v)
-    return pygame.mixer.Sound(buffer=data)
+    return data
 
 def init_music():
+    # Only registers the tracks; SEQUENCER synthesizes them as they play
     # === SMB1 OVERWORLD (Iconic bouncy theme - C major) ===
     # Based on the actual SMB1 melody pattern: E E _ E _ C E _ G _ _ _ G(low)
-    MUSIC["overworld"] = make_music(
+    MUSIC_DEFS["overworld"] = (
         # SMB1 main theme melody approximation
         [76, 76, 0, 76, 0, 72, 76, 0, 79, 0, 0, 0, 67, 0, 0, 0,  # E E _ E _ C E _ G _ _ _ G
          72, 0, 0, 67, 0, 0, 64, 0, 0, 69, 0, 71, 0, 70, 69, 0,  # C _ _ G _ _ E _ _ A _ B _ Bb A
@@ -170,7 +582,7 @@ def init_music():
     )
     
     # === SMB3 OVERWORLD (Funkier, syncopated groove) ===
-    MUSIC["overworld3"] = make_music(
+    MUSIC_DEFS["overworld3"] = (
         # SMB3 World 1 style - more syncopated and playful
         [74, 0, 74, 77, 0, 74, 72, 0, 69, 0, 72, 74, 0, 72, 69, 0,  # D D F# D C A A C D C A
          74, 0, 74, 77, 0, 79, 81, 0, 79, 0, 77, 74, 0, 72, 69, 0,  # D D F# G A G F# D C A
@@ -182,7 +594,7 @@ def init_music():
     )
     
     # === SMB1 UNDERGROUND (Dark chromatic blues) ===
-    MUSIC["underground"] = make_music(
+    MUSIC_DEFS["underground"] = (
         # Underground bass-heavy chromatic theme
         [48, 60, 55, 60, 53, 65, 60, 65, 48, 60, 55, 60, 53, 65, 60, 65,
          50, 62, 57, 62, 55, 67, 62, 67, 48, 60, 55, 60, 53, 65, 60, 65],
@@ -192,7 +604,7 @@ def init_music():
     )
     
     # === SMB3 UNDERGROUND (Groovier bass) ===
-    MUSIC["underground3"] = make_music(
+    MUSIC_DEFS["underground3"] = (
         [60, 0, 63, 67, 0, 63, 60, 0, 58, 0, 61, 65, 0, 61, 58, 0,
          60, 0, 63, 67, 70, 0, 67, 63, 60, 0, 58, 55, 0, 58, 60, 0,
          62, 0, 65, 69, 0, 65, 62, 0, 60, 0, 63, 67, 0, 63, 60, 0,
@@ -203,7 +615,7 @@ def init_music():
     )
     
     # === SMB1 CASTLE (Ominous chromatic) ===
-    MUSIC["castle"] = make_music(
+    MUSIC_DEFS["castle"] = (
         # Chromatic descending menace
         [64, 0, 67, 0, 70, 0, 67, 0, 63, 0, 66, 0, 69, 0, 66, 0,
          62, 0, 65, 0, 68, 0, 65, 0, 64, 0, 67, 0, 70, 0, 67, 0,
@@ -215,7 +627,7 @@ def init_music():
     )
     
     # === SMB3 CASTLE (Fortress theme style) ===
-    MUSIC["castle3"] = make_music(
+    MUSIC_DEFS["castle3"] = (
         [67, 0, 70, 73, 0, 70, 67, 0, 66, 0, 69, 72, 0, 69, 66, 0,
          65, 0, 68, 71, 0, 74, 71, 68, 67, 0, 70, 73, 76, 0, 73, 70,
          67, 70, 73, 0, 76, 0, 73, 70, 67, 0, 64, 0, 67, 70, 73, 0,
@@ -226,7 +638,7 @@ def init_music():
     )
     
     # === SMB1 UNDERWATER (Waltz feel) ===
-    MUSIC["underwater"] = make_music(
+    MUSIC_DEFS["underwater"] = (
         # Lilting 3/4 underwater theme
         [72, 0, 74, 76, 0, 79, 0, 76, 74, 0, 72, 0, 69, 0, 71, 72,
          74, 0, 76, 0, 79, 81, 0, 79, 76, 0, 74, 72, 0, 69, 67, 0,
@@ -239,7 +651,7 @@ def init_music():
     )
     
     # === SMB3 WATER (World 3 style) ===
-    MUSIC["underwater3"] = make_music(
+    MUSIC_DEFS["underwater3"] = (
         [72, 76, 79, 0, 84, 0, 79, 76, 72, 0, 69, 72, 76, 0, 79, 0,
          81, 0, 84, 0, 88, 0, 84, 81, 79, 0, 76, 72, 0, 69, 67, 0,
          72, 0, 76, 0, 79, 84, 0, 88, 91, 0, 88, 84, 79, 0, 76, 0,
@@ -250,7 +662,7 @@ def init_music():
     )
     
     # === STAR POWER (SMB1 invincibility) ===
-    MUSIC["star"] = make_music(
+    MUSIC_DEFS["star"] = (
         [72, 76, 79, 84, 79, 76, 72, 79, 84, 88, 84, 79, 72, 76, 79, 84,
          74, 77, 81, 86, 81, 77, 74, 81, 86, 89, 86, 81, 74, 77, 81, 86,
          76, 79, 84, 88, 91, 88, 84, 79, 74, 77, 81, 86, 89, 86, 81, 77,
@@ -261,7 +673,7 @@ def init_music():
     )
     
     # === SMB3 ATHLETIC (Sky/Athletic theme) ===
-    MUSIC["athletic"] = make_music(
+    MUSIC_DEFS["athletic"] = (
         [76, 0, 79, 84, 0, 88, 84, 79, 76, 0, 79, 84, 0, 88, 91, 0,
          89, 0, 86, 81, 0, 77, 81, 86, 89, 0, 86, 81, 0, 77, 76, 0,
          76, 79, 81, 84, 0, 86, 89, 0, 91, 0, 89, 86, 84, 0, 81, 79,
@@ -272,7 +684,7 @@ def init_music():
     )
     
     # === LEVEL COMPLETE (SMB1 fanfare) ===
-    MUSIC["level_complete"] = make_music(
+    MUSIC_DEFS["level_complete"] = (
         [67, 0, 72, 0, 76, 0, 72, 0, 76, 0, 79, 0, 84, 0, 0, 0,
          0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0],
         [43, 0, 48, 0, 52, 0, 48, 0, 52, 0, 55, 0, 60, 0, 0, 0,
@@ -281,7 +693,7 @@ def init_music():
     )
     
     # === CASTLE COMPLETE ===
-    MUSIC["castle_complete"] = make_music(
+    MUSIC_DEFS["castle_complete"] = (
         [64, 67, 72, 0, 76, 79, 84, 0, 88, 0, 84, 0, 88, 0, 91, 0,
          0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0],
         [40, 43, 48, 0, 52, 55, 60, 0, 64, 0, 60, 0, 64, 0, 67, 0,
@@ -290,7 +702,7 @@ def init_music():
     )
     
     # === GAME OVER ===
-    MUSIC["game_over"] = make_music(
+    MUSIC_DEFS["game_over"] = (
         [72, 0, 0, 0, 67, 0, 0, 0, 64, 0, 0, 0, 60, 0, 0, 0,
          0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0],
         [48, 0, 0, 0, 43, 0, 0, 0, 40, 0, 0, 0, 36, 0, 0, 0,
@@ -299,36 +711,87 @@ def init_music():
     )
     
     # === TITLE SCREEN ===
-    MUSIC["title"] = make_music(
+    MUSIC_DEFS["title"] = (
         [76, 76, 0, 76, 0, 72, 76, 0, 79, 0, 0, 0, 67, 0, 0, 0,
          72, 74, 76, 0, 79, 0, 76, 74, 72, 0, 69, 67, 0, 0, 0, 0],
         [48, 52, 55, 52, 48, 52, 55, 52, 43, 47, 50, 47, 48, 52, 55, 52],
         180, 4.0, 0.125
     )
-    
-    # === HURRY (Time running out) ===
-    MUSIC["hurry"] = make_music(
-        [76, 76, 0, 76, 0, 72, 76, 0, 79, 0, 0, 0, 67, 0, 0, 0],
-        [48, 52, 55, 52, 48, 52, 55, 52],
-        300, 2.0, 0.125
-    )
 
-current_music = None
-music_channel = None
+# === SEQUENCER ===
+# Music is synthesized while it plays: the current MUSIC_DEFS track is
+# rendered SEQ_CHUNK samples at a time and fed to a reserved mixer channel
+# with Channel.queue, one chunk playing and one waiting. Only those two
+# buffers are ever resident, and tempo is a live parameter, so hurry-up is
+# the level track sped up by HURRY_TEMPO rather than a separate render.
+SEQ_CHUNK = 2048  # samples per queued buffer, ~93 ms
+HURRY_TEMPO = 1.5
+
+class Sequencer:
+    def __init__(self):
+        self.channel = None
+        self.name, self.track = None, None
+        self.loops = 0
+        self.pos = 0  # next sample of the current pass through the loop
+        self.t0, self.song0, self.scale = 0.0, 0.0, 1.0  # song time is song0 + (t - t0) * scale
+    
+    def play(self, name, loops=-1):
+        """Start a track from the top at normal tempo; loops=-1 repeats forever."""
+        self.stop()
+        self.name = name
+        if name not in MUSIC_DEFS or not pygame.mixer.get_init(): return
+        if self.channel is None:
+            pygame.mixer.set_reserved(1)  # keep effects off the music channel
+            self.channel = pygame.mixer.Channel(0)
+        self.track, self.loops = MUSIC_DEFS[name], loops
+        self.pos, self.t0, self.song0, self.scale = 0, 0.0, 0.0, 1.0
+        self.pump()
+        self.pump()
+    
+    def stop(self):
+        if self.channel: self.channel.stop()
+        self.name, self.track = None, None
+    
+    def set_tempo(self, scale):
+        """Change tempo from the next chunk on, without restarting the track."""
+        t = self.pos / SAMPLE_RATE
+        self.song0 += (t - self.t0) * self.scale
+        self.t0, self.scale = t, scale
+    
+    def pump(self):
+        """Queue the next chunk once the channel has room; call every frame."""
+        if self.track is None or self.channel.get_queue() is not None: return
+        pcm = self.next_chunk()
+        if pcm: self.channel.queue(pygame.mixer.Sound(buffer=pcm))
+        else: self.track = None
+    
+    def next_chunk(self):
+        """Up to SEQ_CHUNK samples of PCM, wrapping at the loop end; b"" when done."""
+        melody, bass, tempo, duration, duty = self.track
+        chunk, need = b"", SEQ_CHUNK
+        while need:
+            # The pass ends where song time reaches the track's duration
+            end = int(SAMPLE_RATE * (self.t0 + (duration - self.song0) / self.scale))
+            count = min(need, max(end - self.pos, 0))
+            if count:
+                chunk += bytes(render_music(melody, bass, tempo, duty, self.pos, count,
+                                            self.t0, self.song0, self.scale))
+                self.pos += count
+                need -= count
+            if self.pos >= end:
+                if self.loops == 0: break
+                if self.loops > 0: self.loops -= 1
+                self.pos, self.t0, self.song0 = 0, 0.0, 0.0
+        return chunk
+
+SEQUENCER = Sequencer()
 
 def play_music(name, loops=-1):
-    global current_music, music_channel
-    if name == current_music: return
-    if music_channel: music_channel.stop()
-    if name and name in MUSIC:
-        music_channel = pygame.mixer.find_channel(True)
-        if music_channel: music_channel.play(MUSIC[name], loops=loops)
-    current_music = name
+    if name == SEQUENCER.name: return
+    SEQUENCER.play(name, loops)
 
 def stop_music():
-    global current_music, music_channel
-    if music_channel: music_channel.stop()
-    current_music = None
+    SEQUENCER.stop()
 
 def play_sfx(name):
     if name in SFX: SFX[name].play()
@@ -347,7 +810,96 @@ def get_level_music(world, stage, underwater=False):
         return "athletic"
     return "overworld3" if world in smb3_worlds else "overworld"
 
+# === SPRITE ATLAS ===
+# Every draw_* sprite is rendered once per visual variant onto shared atlas
+# pages and blitted from there afterwards. Set SMB1_SPRITE_CACHE=0 to draw
+# with primitives every frame instead.
+SPRITE_CACHE = os.environ.get("SMB1_SPRITE_CACHE", "1") != "0"
+LAYER_KEY = (255, 0, 255)  # transparent colour of atlas pages and baked chunks
+
+class DrawCounter:
+    """Per-frame count of pygame.draw primitives and atlas blits."""
+    PRIMITIVES = ("rect", "ellipse", "polygon", "circle", "line")
+    
+    def __init__(self):
+        self.primitives = self.blits = 0
+        self.last_frame = (0, 0)
+        self.installed = False
+    
+    def install(self):
+        # Primitive counting wraps pygame.draw, so it is opt-in
+        if self.installed: return
+        for name in self.PRIMITIVES:
+            setattr(pygame.draw, name, self._counted(getattr(pygame.draw, name)))
+        self.installed = True
+    
+    def _counted(self, func):
+        def counted(*args, **kwargs):
+            self.primitives += 1
+            return func(*args, **kwargs)
+        return counted
+    
+    def end_frame(self):
+        self.last_frame = (self.primitives, self.blits)
+        self.primitives = self.blits = 0
+        return self.last_frame
+
+DRAW_COUNTER = DrawCounter()
+
+class SpriteAtlas:
+    """Shelf-packed pages holding one pre-rendered image per sprite variant."""
+    PAGE = 512
+    PAD = 8  # room for sprites that draw slightly outside their box
+    
+    def __init__(self):
+        self.pages = []
+        self.entries = {}  # key -> (page, area)
+        self.shelf_x = self.shelf_y = self.shelf_h = 0
+    
+    def _alloc(self, w, h):
+        if self.shelf_x + w > self.PAGE:
+            self.shelf_x, self.shelf_y, self.shelf_h = 0, self.shelf_y + self.shelf_h, 0
+        if not self.pages or self.shelf_y + h > self.PAGE:
+            page = pygame.Surface((self.PAGE, self.PAGE))
+            page.fill(LAYER_KEY)
+            page.set_colorkey(LAYER_KEY)
+            self.pages.append(page)
+            self.shelf_x = self.shelf_y = self.shelf_h = 0
+        area = pygame.Rect(self.shelf_x, self.shelf_y, w, h)
+        self.shelf_x += w
+        self.shelf_h = max(self.shelf_h, h)
+        return self.pages[-1], area
+    
+    def blit(self, surf, key, x, y, w, h, render):
+        entry = self.entries.get(key)
+        if entry is None:
+            page, area = self._alloc(w + 2 * self.PAD, h + 2 * self.PAD)
+            page.set_clip(area)
+            render(page, area.x + self.PAD, area.y + self.PAD)
+            page.set_clip(None)
+            entry = self.entries[key] = (page, area)
+        surf.blit(entry[0], (x - self.PAD, y - self.PAD), entry[1])
+        DRAW_COUNTER.blits += 1
+
+ATLAS = SpriteAtlas()
+
+def sprite(w, h, variant=lambda: ()):
+    """Serve a draw_*(surf, x, y, ...) function from the atlas.
+    
+    variant maps the remaining arguments to everything that changes the
+    image (e.g. frame % 3), so each distinct look is rendered only once.
+    """
+    def wrap(draw):
+        def draw_cached(surf, x, y, *args, **kwargs):
+            if not SPRITE_CACHE: return draw(surf, x, y, *args, **kwargs)
+            key = (draw.__name__, variant(*args, **kwargs))
+            ATLAS.blit(surf, key, x, y, w, h, lambda page, px, py: draw(page, px, py, *args, **kwargs))
+        draw_cached.__name__ = draw.__name__
+        return draw_cached
+    return wrap
+
 # === SPRITE DRAWING ===
+@sprite(16, 32, lambda facing, frame, big=False, fire=False, ducking=False: (frame % 3, big, fire, ducking))
 def draw_mario(surf, x, y, facing, frame, big=False, fire=False, ducking=False):
     h = 16 if not big else (16 if ducking else 32)
     if fire:
@@ -391,6 +943,7 @@ def draw_mario(surf, x, y, facing, frame, big=False, fire=False, ducking=False):
             pygame.draw.rect(surf, shoe, (x+4, y+12, 4, 4))
             pygame.draw.rect(surf, shoe, (x+8, y+12, 4, 4))
 
+@sprite(16, 16, lambda frame, squashed=False: (frame % 2, squashed))
 def draw_goomba(surf, x, y, frame, squashed=False):
     if squashed:
         pygame.draw.rect(surf, Pal.GOOMBA, (x+2, y+12, 12, 4))
@@ -408,6 +961,7 @@ def draw_goomba(surf, x, y, frame, squashed=False):
     pygame.draw.rect(surf, Pal.BLACK, (x+5, y+5, 2, 2))
     pygame.draw.rect(surf, Pal.BLACK, (x+10, y+5, 2, 2))
 
+@sprite(16, 24, lambda frame, red=False, shell_only=False, winged=False: (frame % 2, red, shell_only, winged))
 def draw_koopa(surf, x, y, frame, red=False, shell_only=False, winged=False):
     color = Pal.KOOPA_RED if red else Pal.KOOPA_GREEN
     if shell_only:
@@ -430,6 +984,7 @@ def draw_koopa(surf, x, y, frame, red=False, shell_only=False, winged=False):
         pygame.draw.polygon(surf, Pal.WHITE, [(x-2,wy+4),(x+4,wy),(x+4,wy+6)])
         pygame.draw.polygon(surf, Pal.WHITE, [(x+18,wy+4),(x+12,wy),(x+12,wy+6)])
 
+@sprite(16, 24, lambda height=16: height)
 def draw_piranha(surf, x, y, height=16):
     pygame.draw.rect(surf, Pal.PIPE, (x+5, y+8, 6, height-8))
     pygame.draw.ellipse(surf, Pal.KOOPA_RED, (x+1, y, 14, 12))
@@ -437,6 +992,7 @@ def draw_piranha(surf, x, y, height=16):
     pygame.draw.rect(surf, Pal.WHITE, (x+4, y+4, 2, 5))
     pygame.draw.rect(surf, Pal.WHITE, (x+10, y+4, 2, 5))
 
+@sprite(16, 16, lambda is_1up=False: is_1up)
 def draw_mushroom(surf, x, y, is_1up=False):
     color = Pal.PIPE if is_1up else Pal.MUSHROOM
     pygame.draw.ellipse(surf, color, (x+1, y, 14, 10))
@@ -444,6 +1000,7 @@ def draw_mushroom(surf, x, y, is_1up=False):
     pygame.draw.rect(surf, Pal.WHITE, (x+9, y+2, 2, 4))
     pygame.draw.rect(surf, Pal.WHITE, (x+4, y+8, 8, 8))
 
+@sprite(16, 16, lambda frame: frame % 3)
 def draw_fire_flower(surf, x, y, frame):
     colors = [Pal.FIRE, Pal.MUSHROOM, Pal.WHITE]
     c = colors[frame % 3]
@@ -453,17 +1010,20 @@ def draw_fire_flower(surf, x, y, frame):
     pygame.draw.rect(surf, Pal.WHITE, (x+6, y+4, 4, 4))
     pygame.draw.rect(surf, Pal.PIPE, (x+6, y+12, 4, 4))
 
+@sprite(16, 16, lambda frame: frame % 3)
 def draw_star(surf, x, y, frame):
     colors = [Pal.STAR, Pal.WHITE, Pal.FIRE]
     c = colors[frame % 3]
     pts = [(x+8,y),(x+10,y+6),(x+16,y+6),(x+11,y+10),(x+14,y+16),(x+8,y+12),(x+2,y+16),(x+5,y+10),(x,y+6),(x+6,y+6)]
     pygame.draw.polygon(surf, c, pts)
 
+@sprite(16, 16, lambda frame: frame % 4)
 def draw_coin(surf, x, y, frame):
     widths = [8, 6, 2, 6]
     w = widths[frame % 4]
     pygame.draw.ellipse(surf, Pal.COIN, (x + 8 - w//2, y+2, w, 12))
 
+@sprite(16, 16, lambda underground=False: underground)
 def draw_brick(surf, x, y, underground=False):
     color = (100,100,100) if underground else Pal.BRICK
     dark = (60,60,60) if underground else Pal.BRICK_DARK
@@ -471,6 +1031,7 @@ def draw_brick(surf, x, y, underground=False):
     pygame.draw.rect(surf, dark, (x, y+7, 16, 2))
     pygame.draw.rect(surf, dark, (x+7, y, 2, 16))
 
+@sprite(16, 16, lambda frame, used=False: (used, not used and (frame//8)%2))
 def draw_question(surf, x, y, frame, used=False):
     if used:
         pygame.draw.rect(surf, Pal.BRICK_DARK, (x, y, 16, 16))
@@ -482,17 +1043,20 @@ def draw_question(surf, x, y, frame, used=False):
     pygame.draw.rect(surf, Pal.WHITE, (x+5, y+4, 6, 5))
     pygame.draw.rect(surf, Pal.WHITE, (x+7, y+10, 2, 2))
 
+@sprite(16, 16)
 def draw_ground(surf, x, y):
     pygame.draw.rect(surf, Pal.GROUND, (x, y, 16, 16))
     pygame.draw.rect(surf, Pal.GROUND_DARK, (x, y, 16, 4))
     pygame.draw.rect(surf, Pal.GROUND_DARK, (x+4, y+8, 2, 2))
     pygame.draw.rect(surf, Pal.GROUND_DARK, (x+10, y+12, 2, 2))
 
+@sprite(16, 16)
 def draw_hard(surf, x, y):
     pygame.draw.rect(surf, Pal.CASTLE_GRAY, (x, y, 16, 16))
     pygame.draw.rect(surf, Pal.CASTLE_DARK, (x, y+8, 16, 2))
     pygame.draw.rect(surf, Pal.CASTLE_DARK, (x+8, y, 2, 16))
 
+@sprite(16, 16, lambda left=True: left)
 def draw_pipe_top(surf, x, y, left=True):
     pygame.draw.rect(surf, Pal.PIPE, (x, y, 16, 16))
     if left:
@@ -500,6 +1064,7 @@ def draw_pipe_top(surf, x, y, left=True):
     else:
         pygame.draw.rect(surf, Pal.PIPE_DARK, (x+12, y, 4, 16))
 
+@sprite(16, 16, lambda left=True: left)
 def draw_pipe_body(surf, x, y, left=True):
     pygame.draw.rect(surf, Pal.PIPE, (x+(2 if left else 0), y, 14, 16))
     if left:
@@ -508,11 +1073,19 @@ def draw_pipe_body(surf, x, y, left=True):
         pygame.draw.rect(surf, Pal.PIPE_DARK, (x+10, y, 4, 16))
 
 def draw_flagpole(surf, x, y, flag_y=0):
+    draw_pole(surf, x, y)
+    draw_flag(surf, x, y + 16 + int(flag_y))
+
+@sprite(16, 160)
+def draw_pole(surf, x, y):
     pygame.draw.rect(surf, Pal.CASTLE_GRAY, (x+7, y, 2, 160))
     pygame.draw.circle(surf, Pal.STAR, (x+8, y), 4)
-    flag_top = y + 16 + int(flag_y)
+
+@sprite(16, 16)
+def draw_flag(surf, x, flag_top):
     pygame.draw.polygon(surf, Pal.PIPE, [(x+8,flag_top),(x-8,flag_top+8),(x+8,flag_top+16)])
 
+@sprite(80, 80)
 def draw_castle(surf, x, y):
     pygame.draw.rect(surf, Pal.CASTLE_GRAY, (x, y+32, 80, 48))
     for i in range(5):
@@ -521,22 +1094,27 @@ def draw_castle(surf, x, y):
     pygame.draw.rect(surf, Pal.BLACK, (x+8, y+48, 12, 12))
     pygame.draw.rect(surf, Pal.BLACK, (x+60, y+48, 12, 12))
 
+@sprite(56, 24)
 def draw_cloud(surf, x, y):
     pygame.draw.ellipse(surf, Pal.WHITE, (x, y+8, 24, 16))
     pygame.draw.ellipse(surf, Pal.WHITE, (x+16, y, 24, 20))
     pygame.draw.ellipse(surf, Pal.WHITE, (x+32, y+8, 24, 16))
 
+@sprite(56, 24)
 def draw_bush(surf, x, y):
     pygame.draw.ellipse(surf, Pal.PIPE, (x, y+8, 24, 16))
     pygame.draw.ellipse(surf, Pal.PIPE, (x+16, y, 24, 20))
     pygame.draw.ellipse(surf, Pal.PIPE, (x+32, y+8, 24, 16))
 
+@sprite(80, 52)
 def draw_hill(surf, x, y):
     pygame.draw.polygon(surf, (0, 148, 0), [(x, y+48), (x+40, y), (x+80, y+48)])
     pygame.draw.ellipse(surf, (0, 148, 0), (x+20, y+32, 40, 20))
 
 # === ENTITIES ===
 class Entity:
+    __slots__ = ("x", "y", "vx", "vy", "w", "h", "alive", "on_ground", "facing", "frame")
+    
     def __init__(self, x, y):
         self.x, self.y = float(x), float(y)
         self.vx, self.vy = 0.0, 0.0
@@ -554,6 +1132,8 @@ class Entity:
     def draw(self, surf, cam): pass
 
 class Goomba(Entity):
+    __slots__ = ("squash_timer",)
+    
     def __init__(self, x, y):
         super().__init__(x, y)
         self.vx = -Phys.GOOMBA_SPEED
@@ -566,17 +1146,10 @@ class Goomba(Entity):
             return
         self.frame += 1
         self.vy = min(self.vy + Phys.GRAVITY, Phys.MAX_FALL)
-        self.x += self.vx
-        self.y += self.vy
-        self.on_ground = False
-        for tile in level.get_nearby_tiles(self.x, self.y):
-            if tile.solid and self.rect.colliderect(tile.rect):
-                if self.vy > 0 and self.y + self.h - self.vy <= tile.y:
-                    self.y = tile.y - self.h
-                    self.vy = 0
-                    self.on_ground = True
-                elif self.vx != 0:
-                    self.vx = -self.vx
+        self.x, self.y, hit_col, hit_row = level.move(self.x, self.y, self.w, self.h, self.vx, self.vy)
+        self.on_ground = hit_row is not None and self.vy > 0
+        if hit_row is not None: self.vy = 0
+        if hit_col is not None: self.vx = -self.vx
         if self.y > NES_H + 32: self.alive = False
     
     def stomp(self):
@@ -587,6 +1160,8 @@ class Goomba(Entity):
         draw_goomba(surf, int(self.x - cam), int(self.y), self.frame//8, self.squash_timer > 0)
 
 class Koopa(Entity):
+    __slots__ = ("red", "winged", "shell_only", "shell_moving", "shell_timer")
+    
     def __init__(self, x, y, red=False, winged=False):
         super().__init__(x, y)
         self.h = 24
@@ -613,23 +1188,13 @@ class Koopa(Entity):
             self.vy = min(self.vy + Phys.GRAVITY, Phys.MAX_FALL)
         else:
             self.vy = math.sin(self.frame / 20.0) * 1.5
-        self.x += self.vx
-        self.y += self.vy
-        self.on_ground = False
-        for tile in level.get_nearby_tiles(self.x, self.y):
-            if tile.solid and self.rect.colliderect(tile.rect):
-                if self.vy > 0 and self.y + self.h - self.vy <= tile.y:
-                    self.y = tile.y - self.h
-                    self.vy = 0
-                    self.on_ground = True
-                elif self.shell_moving:
-                    self.facing = -self.facing
-                else:
-                    self.facing = -self.facing
-                    self.x += self.vx
+        self.x, self.y, hit_col, hit_row = level.move(self.x, self.y, self.w, self.h, self.vx, self.vy)
+        self.on_ground = hit_row is not None and self.vy > 0
+        if hit_row is not None: self.vy = 0
+        if hit_col is not None: self.facing = -self.facing
         if self.red and not self.shell_only and self.on_ground:
             test_x = self.x + (self.w if self.facing > 0 else -4)
-            has_floor = any(t.solid and t.rect.collidepoint(test_x, self.y + self.h + 4) for t in level.get_nearby_tiles(test_x, self.y + self.h))
+            has_floor = level.is_solid(int(test_x) // T, int(self.y + self.h + 4) // T)
             if not has_floor: self.facing = -self.facing
         if self.y > NES_H + 32: self.alive = False
     
@@ -654,6 +1219,8 @@ class Koopa(Entity):
         draw_koopa(surf, int(self.x - cam), int(self.y), self.frame//8, self.red, self.shell_only, self.winged)
 
 class PiranhaPlant(Entity):
+    __slots__ = ("base_y", "timer", "state", "offset")
+    
     def __init__(self, x, y):
         super().__init__(x, y)
         self.base_y = y
@@ -688,6 +1255,8 @@ class PiranhaPlant(Entity):
             draw_piranha(surf, int(self.x - cam), int(self.y), int(self.offset))
 
 class Fireball(Entity):
+    __slots__ = ()
+    
     def __init__(self, x, y, direction):
         super().__init__(x, y)
         self.w, self.h = 8, 8
@@ -696,15 +1265,11 @@ class Fireball(Entity):
     def update(self, level):
         self.frame += 1
         self.vy = min(self.vy + Phys.GRAVITY, 3)
-        self.x += self.vx
-        self.y += self.vy
-        for tile in level.get_nearby_tiles(self.x, self.y):
-            if tile.solid and self.rect.colliderect(tile.rect):
-                if self.vy > 0:
-                    self.y = tile.y - self.h
-                    self.vy = -3
-                else:
-                    self.alive = False
+        self.x, self.y, hit_col, hit_row = level.move(self.x, self.y, self.w, self.h, self.vx, self.vy)
+        if hit_col is not None or (hit_row is not None and self.vy < 0):
+            self.alive = False
+        elif hit_row is not None:
+            self.vy = -3
         if self.x < 0 or self.x > level.width * T or self.y > NES_H:
             self.alive = False
     
@@ -713,6 +1278,8 @@ class Fireball(Entity):
         pygame.draw.circle(surf, colors[self.frame % 3], (int(self.x - cam + 4), int(self.y + 4)), 4)
 
 class Mushroom(Entity):
+    __slots__ = ("is_1up", "emerging", "emerge_y")
+    
     def __init__(self, x, y, is_1up=False):
         super().__init__(x, y)
         self.is_1up = is_1up
@@ -726,21 +1293,17 @@ class Mushroom(Entity):
             if self.emerge_y - self.y >= 16: self.emerging = False
             return
         self.vy = min(self.vy + Phys.GRAVITY, Phys.MAX_FALL)
-        self.x += self.vx
-        self.y += self.vy
-        for tile in level.get_nearby_tiles(self.x, self.y):
-            if tile.solid and self.rect.colliderect(tile.rect):
-                if self.vy > 0:
-                    self.y = tile.y - self.h
-                    self.vy = 0
-                elif self.vx != 0:
-                    self.vx = -self.vx
+        self.x, self.y, hit_col, hit_row = level.move(self.x, self.y, self.w, self.h, self.vx, self.vy)
+        if hit_row is not None: self.vy = 0
+        if hit_col is not None: self.vx = -self.vx
         if self.y > NES_H + 32: self.alive = False
     
     def draw(self, surf, cam):
         draw_mushroom(surf, int(self.x - cam), int(self.y), self.is_1up)
 
 class FireFlower(Entity):
+    __slots__ = ("emerging", "emerge_y")
+    
     def __init__(self, x, y):
         super().__init__(x, y)
         self.emerging = True
@@ -756,6 +1319,8 @@ class FireFlower(Entity):
         draw_fire_flower(surf, int(self.x - cam), int(self.y), self.frame//4)
 
 class Star(Entity):
+    __slots__ = ("emerging", "emerge_y")
+    
     def __init__(self, x, y):
         super().__init__(x, y)
         self.vx = 1.5
@@ -769,21 +1334,17 @@ class Star(Entity):
             if self.emerge_y - self.y >= 16: self.emerging = False
             return
         self.vy = min(self.vy + Phys.GRAVITY, Phys.MAX_FALL)
-        self.x += self.vx
-        self.y += self.vy
-        for tile in level.get_nearby_tiles(self.x, self.y):
-            if tile.solid and self.rect.colliderect(tile.rect):
-                if self.vy > 0:
-                    self.y = tile.y - self.h
-                    self.vy = -5
-                elif self.vx != 0:
-                    self.vx = -self.vx
+        self.x, self.y, hit_col, hit_row = level.move(self.x, self.y, self.w, self.h, self.vx, self.vy)
+        if hit_row is not None: self.vy = -5 if self.vy > 0 else 0
+        if hit_col is not None: self.vx = -self.vx
         if self.y > NES_H + 32: self.alive = False
     
     def draw(self, surf, cam):
         draw_star(surf, int(self.x - cam), int(self.y), self.frame//4)
 
 class Coin(Entity):
+    __slots__ = ("from_block", "timer")
+    
     def __init__(self, x, y, from_block=False):
         super().__init__(x, y)
         self.from_block = from_block
@@ -801,68 +1362,170 @@ class Coin(Entity):
     def draw(self, surf, cam):
         draw_coin(surf, int(self.x - cam), int(self.y), self.frame//4)
 
-class BrickParticle(Entity):
-    def __init__(self, x, y, vx, vy):
-        super().__init__(x, y)
-        self.vx, self.vy = vx, vy
-        self.w, self.h = 8, 8
+class EntityPool:
+    """Free list of dead entities of one class, reinitialised in place on spawn.
     
-    def update(self, level):
-        self.vy += 0.25
-        self.x += self.vx
-        self.y += self.vy
-        if self.y > NES_H + 32: self.alive = False
+    Short-lived entities (block and level coins) cycle through here instead
+    of being allocated and collected every few frames.
+    """
+    def __init__(self, cls):
+        self.cls = cls
+        self.free = []
+    
+    def spawn(self, *args, **kwargs):
+        if not self.free: return self.cls(*args, **kwargs)
+        entity = self.free.pop()
+        entity.__init__(*args, **kwargs)
+        return entity
+
+POOLS = {Coin: EntityPool(Coin)}
+
+def recycle(entity):
+    """Return a dead entity to its class's pool, if it has one."""
+    pool = POOLS.get(type(entity))
+    if pool is not None: pool.free.append(entity)
+
+class ParticlePool:
+    """Brick debris stored as parallel x/y/vx/vy arrays rather than an object each.
+    
+    With NumPy the arrays are preallocated and the pool integrates in a
+    handful of vector ops per frame, compacting dead particles out in place
+    so live ones stay packed in [0, len). Without it they are plain lists
+    rebuilt by comprehension each frame.
+    """
+    GRAVITY = 0.25
+    SIZE = 8
+    chip = None  # shared SIZE x SIZE brick-coloured Surface
+    
+    def __init__(self, capacity=16, vectorized=None):
+        self.vectorized = np is not None if vectorized is None else vectorized
+        self.n = 0
+        if self.vectorized:
+            self.x, self.y, self.vx, self.vy = (np.zeros(capacity) for _ in range(4))
+        else:
+            self.x, self.y, self.vx, self.vy = [], [], [], []
+    
+    def __len__(self):
+        return self.n
+    
+    def spawn(self, x, y, vx, vy):
+        n = self.n
+        self.n = n + 1
+        if not self.vectorized:
+            self.x.append(x); self.y.append(y); self.vx.append(vx); self.vy.append(vy)
+            return
+        if n == len(self.x):
+            self.x, self.y, self.vx, self.vy = (np.concatenate((a, np.zeros(n))) for a in (self.x, self.y, self.vx, self.vy))
+        self.x[n], self.y[n], self.vx[n], self.vy[n] = x, y, vx, vy
+    
+    def update(self):
+        n = self.n
+        if not n: return
+        gravity, floor = self.GRAVITY, NES_H + 32
+        if self.vectorized:
+            x, y, vy = self.x[:n], self.y[:n], self.vy[:n]
+            vy += gravity
+            x += self.vx[:n]
+            y += vy
+            alive = y <= floor
+            if not alive.all():
+                self.n = int(alive.sum())
+                for a in (self.x, self.y, self.vx, self.vy): a[:self.n] = a[:n][alive]
+            return
+        self.vy = [vy + gravity for vy in self.vy]
+        self.x = [x + vx for x, vx in zip(self.x, self.vx)]
+        self.y = [y + vy for y, vy in zip(self.y, self.vy)]
+        if max(self.y) > floor:
+            live = [i for i, y in enumerate(self.y) if y <= floor]
+            self.x, self.y, self.vx, self.vy = ([a[i] for i in live] for a in (self.x, self.y, self.vx, self.vy))
+            self.n = len(live)
     
     def draw(self, surf, cam):
-        pygame.draw.rect(surf, Pal.BRICK, (int(self.x - cam), int(self.y), 8, 8))
+        n = self.n
+        if not n: return
+        if self.vectorized:
+            xs, ys = (self.x[:n] - cam).astype(int).tolist(), self.y[:n].astype(int).tolist()
+        else:
+            xs, ys = [int(x - cam) for x in self.x], [int(y) for y in self.y]
+        chip = ParticlePool.chip
+        if chip is None:
+            chip = ParticlePool.chip = pygame.Surface((self.SIZE, self.SIZE))
+            chip.fill(Pal.BRICK)
+        surf.blits([(chip, pos) for pos in zip(xs, ys)], doreturn=False)
+        DRAW_COUNTER.blits += n
+    
+    def snapshot(self):
+        """(kind, x, y, vx, vy, alive) rows for state checksums, as plain floats."""
+        n = self.n
+        return [("BrickParticle", float(x), float(y), float(vx), float(vy), True)
+                for x, y, vx, vy in zip(self.x[:n], self.y[:n], self.vx[:n], self.vy[:n])]
 
 # === TILES ===
+# Tile types live in Level.tilemap, one byte per cell. Only blocks that carry
+# state (contents, coin counts, a bump in progress) get a Tile record in the
+# level's sparse Level.blocks table.
+TILE_TYPES = ["empty", "ground", "brick", "question", "used", "hard",
+              "pipe_tl", "pipe_tr", "pipe_l", "pipe_r", "castle_block"]
+TILE_CODE = {name: code for code, name in enumerate(TILE_TYPES)}
+TILE_SOLID = bytes(name != "empty" for name in TILE_TYPES)
+
+# Static tiles are baked into strips of CHUNK_COLS columns, keyed out by LAYER_KEY
+CHUNK_COLS = 16
+CHUNK_W = CHUNK_COLS * T
+
+# Level characters that place a tile: (tile type, block contents)
+TILE_CHARS = {
+    '#': ("ground", None), 'B': ("brick", None), 'H': ("hard", None),
+    '?': ("question", "coin"), 'M': ("question", "mushroom"), 'S': ("question", "star"),
+    '1': ("brick", "1up"), 'C': ("brick", "multi_coin"),
+    '[': ("pipe_tl", None), ']': ("pipe_tr", None), '{': ("pipe_l", None), '}': ("pipe_r", None),
+}
+
 class Tile:
-    def __init__(self, x, y, tile_type):
-        self.x, self.y = x, y
-        self.type = tile_type
-        self.rect = pygame.Rect(x, y, T, T)
-        self.solid = tile_type not in ["empty", "coin", "bg", "flag", "castle_end"]
+    def __init__(self, col, row, contents=None):
+        self.col, self.row = col, row
+        self.x, self.y = col * T, row * T
         self.used = False
         self.bump_offset = 0
-        self.contents = None
+        self.contents = contents
         self.coin_count = 0
     
     def bump(self, level, player):
         if self.bump_offset > 0: return
-        if self.type == "brick":
+        kind = level.tile_type(self.col, self.row)
+        if kind == "brick":
             if self.contents and not self.used:
                 play_sfx("bump")
-                self.bump_offset = 4
+                self.start_bump(level)
                 if self.contents == "multi_coin":
                     self.coin_count -= 1
-                    level.items.append(Coin(self.x, self.y - 16, from_block=True))
+                    level.items.append(POOLS[Coin].spawn(self.x, self.y - 16, from_block=True))
                     level.coins += 1
                     play_sfx("coin")
                     if self.coin_count <= 0:
                         self.used = True
-                        self.type = "used"
+                        level.set_tile(self.col, self.row, "used")
                 else:
                     self.used = True
                     self.spawn_contents(level, player)
             elif player.big:
                 play_sfx("break")
-                self.type = "empty"
-                self.solid = False
+                level.set_tile(self.col, self.row, "empty")
+                del level.blocks[(self.col, self.row)]
                 for dx, dy in [(-1,-4),(1,-4),(-2,-2),(2,-2)]:
-                    level.particles.append(BrickParticle(self.x+4, self.y+4, dx, dy))
+                    level.particles.spawn(self.x+4, self.y+4, dx, dy)
             else:
                 play_sfx("bump")
-                self.bump_offset = 4
-        elif self.type == "question" and not self.used:
+                self.start_bump(level)
+        elif kind == "question" and not self.used:
             play_sfx("bump")
-            self.bump_offset = 4
+            self.start_bump(level)
             self.used = True
             self.spawn_contents(level, player)
     
     def spawn_contents(self, level, player):
         if self.contents == "coin" or self.contents is None:
-            level.items.append(Coin(self.x, self.y - 16, from_block=True))
+            level.items.append(POOLS[Coin].spawn(self.x, self.y - 16, from_block=True))
             level.coins += 1
             play_sfx("coin")
         elif self.contents == "mushroom":
@@ -878,31 +1541,37 @@ class Tile:
             level.items.append(Mushroom(self.x, self.y, is_1up=True))
             play_sfx("sprout")
     
-    def update(self):
-        if self.bump_offset > 0: self.bump_offset -= 1
-    
-    def draw(self, surf, cam, frame, underground=False):
-        x = int(self.x - cam)
-        y = int(self.y - self.bump_offset)
-        if self.type == "ground": draw_ground(surf, x, y)
-        elif self.type == "brick": draw_brick(surf, x, y, underground)
-        elif self.type == "question": draw_question(surf, x, y, frame, self.used)
-        elif self.type == "used": draw_question(surf, x, y, frame, True)
-        elif self.type == "hard": draw_hard(surf, x, y)
-        elif self.type == "pipe_tl": draw_pipe_top(surf, x, y, True)
-        elif self.type == "pipe_tr": draw_pipe_top(surf, x, y, False)
-        elif self.type == "pipe_l": 
-            # For short 2-tile pipes, draw just the top part
-            pygame.draw.rect(surf, Pal.PIPE, (x+2, y, 14, 16))
-            pygame.draw.rect(surf, Pal.PIPE_LIGHT, (x+2, y, 4, 16))
-        elif self.type == "pipe_r": 
-            # For short 2-tile pipes, draw just the top part
-            pygame.draw.rect(surf, Pal.PIPE, (x, y, 14, 16))
-            pygame.draw.rect(surf, Pal.PIPE_DARK, (x+10, y, 4, 16))
-        elif self.type == "castle_block":
-            pygame.draw.rect(surf, Pal.CASTLE_GRAY, (x, y, T, T))
-            pygame.draw.rect(surf, Pal.CASTLE_DARK, (x, y, T, 2))
-            pygame.draw.rect(surf, Pal.CASTLE_DARK, (x, y, 2, T))
+    def start_bump(self, level):
+        self.bump_offset = 4
+        level.active_blocks.append(self)
+        level.invalidate_tile(self.col, self.row)
+    
+    def update(self, level):
+        self.bump_offset -= 1
+        if self.bump_offset <= 0:
+            level.active_blocks.remove(self)
+            level.invalidate_tile(self.col, self.row)
+
+def draw_tile(surf, kind, x, y, frame, underground=False, used=False):
+    if kind == "ground": draw_ground(surf, x, y)
+    elif kind == "brick": draw_brick(surf, x, y, underground)
+    elif kind == "question": draw_question(surf, x, y, frame, used)
+    elif kind == "used": draw_question(surf, x, y, frame, True)
+    elif kind == "hard": draw_hard(surf, x, y)
+    elif kind == "pipe_tl": draw_pipe_top(surf, x, y, True)
+    elif kind == "pipe_tr": draw_pipe_top(surf, x, y, False)
+    elif kind == "pipe_l": 
+        # For short 2-tile pipes, draw just the top part
+        pygame.draw.rect(surf, Pal.PIPE, (x+2, y, 14, 16))
+        pygame.draw.rect(surf, Pal.PIPE_LIGHT, (x+2, y, 4, 16))
+    elif kind == "pipe_r": 
+        # For short 2-tile pipes, draw just the top part
+        pygame.draw.rect(surf, Pal.PIPE, (x, y, 14, 16))
+        pygame.draw.rect(surf, Pal.PIPE_DARK, (x+10, y, 4, 16))
+    elif kind == "castle_block":
+        pygame.draw.rect(surf, Pal.CASTLE_GRAY, (x, y, T, T))
+        pygame.draw.rect(surf, Pal.CASTLE_DARK, (x, y, T, 2))
+        pygame.draw.rect(surf, Pal.CASTLE_DARK, (x, y, 2, T))
 
 # === PLAYER ===
 class Player:
@@ -936,7 +1605,7 @@ class Player:
         h = 16 if not self.big or self.ducking else 32
         return pygame.Rect(int(self.x) + 1, int(self.y) + (32 - h if self.big else 0), self.w, h)
     
-    def update(self, keys, level):
+    def update(self, buttons, level):
         if self.dead:
             self.death_timer += 1
             if self.death_timer < 30: return
@@ -956,23 +1625,29 @@ class Player:
         if self.star_power > 0: self.star_power -= 1
         self.anim_timer += 1
         
-        left = keys[pygame.K_LEFT] or keys[pygame.K_a]
-        right = keys[pygame.K_RIGHT] or keys[pygame.K_d]
-        run = keys[pygame.K_x] or keys[pygame.K_LSHIFT]
-        jump = keys[pygame.K_z] or keys[pygame.K_SPACE]
-        down = keys[pygame.K_DOWN] or keys[pygame.K_s]
+        left = bool(buttons & Buttons.LEFT)
+        right = bool(buttons & Buttons.RIGHT)
+        run = bool(buttons & Buttons.RUN)
+        jump = bool(buttons & Buttons.JUMP)
+        down = bool(buttons & Buttons.DOWN)
         
         self.ducking = down and self.big and self.on_ground
+        walking = not self.ducking
+        # Level.move cannot free a box that starts inside a wall, so a player
+        # grown or standing up under a low ceiling stays crouched (but keeps
+        # walking) until the top half of the big hitbox is clear
+        if self.big and not self.ducking and level.overlaps(self.x + 1, self.y, self.w, 16):
+            self.ducking = True
         max_speed = Phys.RUN_MAX if run else Phys.WALK_MAX
         accel = Phys.RUN_ACCEL if run else Phys.WALK_ACCEL
         
-        if right and not self.ducking:
+        if right and walking:
             self.facing = 1
             if self.vx < 0:
                 self.vx += Phys.SKID_DECEL
             else:
                 self.vx = min(self.vx + accel, max_speed)
-        elif left and not self.ducking:
+        elif left and walking:
             self.facing = -1
             if self.vx > 0:
                 self.vx -= Phys.SKID_DECEL
@@ -1002,9 +1677,6 @@ class Player:
             gravity = Phys.GRAVITY
         self.vy = min(self.vy + gravity, Phys.MAX_FALL)
         
-        self.x += self.vx
-        self.y += self.vy
-        
         if not self.on_ground: self.frame = 2
         elif abs(self.vx) > 0.5:
             if self.anim_timer % 8 == 0: self.frame = (self.frame + 1) % 3
@@ -1013,34 +1685,22 @@ class Player:
         self.on_ground = False
         self.h = 16 if not self.big or self.ducking else 32
         
-        # Improved collision detection
-        for tile in level.get_nearby_tiles(self.x, self.y):
-            if not tile.solid: continue
-            rect = self.rect
-            if not rect.colliderect(tile.rect): continue
-            
-            # Determine collision direction
-            dx = rect.centerx - tile.rect.centerx
-            dy = rect.centery - tile.rect.centery
-            
-            if abs(dx) > abs(dy):
-                # Horizontal collision
-                if self.vx > 0:
-                    self.x = tile.rect.left - self.w - 1
-                elif self.vx < 0:
-                    self.x = tile.rect.right - 1
-                self.vx = 0
-            else:
-                # Vertical collision
-                if self.vy > 0:
-                    self.y = tile.rect.top - self.h
-                    self.vy = 0
-                    self.on_ground = True
-                    self.jumping = False
-                elif self.vy < 0:
-                    self.y = tile.rect.bottom
-                    self.vy = 0
-                    tile.bump(level, self)
+        # The hitbox sits 1px in from x and at the bottom of the 32px big sprite
+        top = 32 - self.h if self.big else 0
+        x, y, hit_col, hit_row = level.move(self.x + 1, self.y + top, self.w, self.h, self.vx, self.vy)
+        self.x, self.y = x - 1, y - top
+        if hit_col is not None: self.vx = 0
+        if hit_row is not None and self.vy > 0:
+            self.vy = 0
+            self.on_ground = True
+            self.jumping = False
+        elif hit_row is not None:
+            self.vy = 0
+            # Bump the block over the hitbox centre, else the other one it touches
+            col = int((x + self.w / 2) // T)
+            if not level.is_solid(col, hit_row):
+                col = int(x // T) if col != int(x // T) else int((x + self.w - 1) // T)
+            level.bump_tile(col, hit_row, self)
         
         # Keep player on screen
         if self.x < 0: self.x, self.vx = 0, 0
@@ -1063,6 +1723,7 @@ class Player:
             self.shrink_timer = 45
         elif self.big:
             self.big = False
+            self.y += 16  # keep the feet where they were
             self.invincible = 120
             self.shrink_timer = 45
         else:
@@ -1075,10 +1736,13 @@ class Player:
                 return "1up"
             elif not self.big:
                 self.big = True
+                self.y -= 16
                 self.grow_timer = 45
                 play_sfx("powerup")
         elif isinstance(item, FireFlower):
-            if not self.big: self.big = True
+            if not self.big:
+                self.big = True
+                self.y -= 16
             self.fire = True
             self.grow_timer = 45
             play_sfx("powerup")
@@ -1093,75 +1757,301 @@ class Player:
         if self.invincible > 0 and (self.invincible // 4) % 2 == 0: return
         if (self.grow_timer + self.shrink_timer) > 0 and ((self.grow_timer + self.shrink_timer) // 4) % 2 == 0: return
         x, y = int(self.x - cam), int(self.y)
+        if self.big and self.ducking: y += 16  # the hitbox is the bottom half
         fire_display = self.fire
         if self.star_power > 0: fire_display = (frame // 4) % 2 == 0
         draw_mario(surf, x, y, self.facing, self.frame, self.big, fire_display, self.ducking)
         for fb in self.fireballs: fb.draw(surf, cam)
 
+# === BROAD PHASE ===
+class SpatialHash:
+    """Entities bucketed by the tile column their left edge is in, rebuilt per frame.
+    
+    Levels are one screen tall, so columns alone keep buckets to a handful of
+    entities. No entity is wider than a tile, so a query only has to look one
+    column left of its rect to find everything that can overlap it.
+    """
+    def __init__(self, entities):
+        self.entities = entities
+        self.buckets = buckets = {}
+        for index, entity in enumerate(entities):
+            col = int(entity.x) // T
+            if col in buckets: buckets[col].append(index)
+            else: buckets[col] = [index]
+    
+    def query(self, rect):
+        """Entities that can overlap rect along x, in list order."""
+        buckets = self.buckets
+        hits = []
+        for col in range((rect.left - T + 1) // T, (rect.right - 1) // T + 1):
+            if col in buckets: hits += buckets[col]
+        hits.sort()
+        return [self.entities[index] for index in hits]
+
+# === LEVEL FORMAT ===
+# LEVEL_DATA rows are compiled once into a flat blob that Level loads with
+# no character parsing, and the blob is kept in the disk cache next to the
+# PCM (keyed by the rows and this compiler's bytecode). Layout: header, the
+# column-major tile-code grid, then the block and spawn tables.
+LEVEL_MAGIC = b"SMBL"
+LEVEL_VERSION = 1
+LEVEL_HEADER = struct.Struct("<4sBHHBiiHH")  # magic, version, width, cols, height, flagpole x, castle x, blocks, spawns
+LEVEL_BLOCK = struct.Struct("<HBB")  # col, row, contents code
+LEVEL_SPAWN = struct.Struct("<cHB")  # level character, col, row
+BLOCK_CONTENTS = [None, "coin", "mushroom", "star", "1up", "multi_coin"]
+# Tile-code per level character, for bytes.translate
+TILE_TABLE = bytes(TILE_CODE[TILE_CHARS[chr(c)][0]] if chr(c) in TILE_CHARS else 0 for c in range(256))
+# Characters that need more than a tile code: block contents, spawns, markers
+LEVEL_MARKS = re.compile(r"[?MS1CogkrwpPK]")
+SPAWNERS = {
+    b'o': lambda x, y: POOLS[Coin].spawn(x, y),
+    b'g': lambda x, y: Goomba(x, y),
+    b'k': lambda x, y: Koopa(x, y),
+    b'r': lambda x, y: Koopa(x, y, red=True),
+    b'w': lambda x, y: Koopa(x, y, winged=True),
+    b'p': lambda x, y: PiranhaPlant(x, y - 8),
+}
+LEVEL_BLOBS = {}  # (world, stage) -> compiled level, for restarts
+
+def compile_level(data):
+    """Compile level rows into the LEVEL_HEADER blob that Level.load reads."""
+    height = len(data)
+    width = len(data[0]) if data else 0
+    # Rows can run past data[0] (1-1's ground does), so the map spans the longest
+    cols = max(map(len, data), default=0)
+    tilemap = bytearray(cols * height)
+    blocks, spawns = bytearray(), bytearray()
+    nblocks = nspawns = flagpole_x = castle_x = 0
+    for row_idx, row in enumerate(data):
+        codes = row.encode().translate(TILE_TABLE)
+        tilemap[row_idx::height] = codes + bytes(cols - len(codes))
+        for match in LEVEL_MARKS.finditer(row):
+            char, col_idx = match.group(), match.start()
+            if char in TILE_CHARS:
+                blocks += LEVEL_BLOCK.pack(col_idx, row_idx, BLOCK_CONTENTS.index(TILE_CHARS[char][1]))
+                nblocks += 1
+            elif char == 'P': flagpole_x = col_idx * T
+            elif char == 'K': castle_x = col_idx * T
+            else:
+                spawns += LEVEL_SPAWN.pack(char.encode(), col_idx, row_idx)
+                nspawns += 1
+    header = LEVEL_HEADER.pack(LEVEL_MAGIC, LEVEL_VERSION, width, cols, height, flagpole_x, castle_x, nblocks, nspawns)
+    return header + tilemap + blocks + spawns
+
+def _level_fingerprint():
+    """Everything besides the rows and the compiler's bytecode that shapes a blob."""
+    return (_code_key(compile_level.__code__), LEVEL_HEADER.format, LEVEL_BLOCK.format, LEVEL_SPAWN.format,
+            tuple(TILE_TYPES), sorted(TILE_CHARS.items()), tuple(BLOCK_CONTENTS),
+            LEVEL_MARKS.pattern, sorted(SPAWNERS))
+
+def level_blob(world, stage):
+    """The compiled blob for a stage (1-1 for unknown ones), from memory or disk."""
+    blob = LEVEL_BLOBS.get((world, stage))
+    if blob is None:
+        data = LEVEL_DATA.get((world, stage), LEVEL_DATA[(1, 1)])
+        key = (LEVEL_VERSION, _level_fingerprint(), data)
+        blob = LEVEL_BLOBS[(world, stage)] = cached_blob(key, lambda: compile_level(data), ".lvl")
+    return blob
+
 # === LEVEL ===
+# Enemies sleep until they come within ACTIVATE_MARGIN of the right screen
+# edge, like the NES spawn column, and are culled once CULL_MARGIN behind.
+ACTIVATE_MARGIN = 2 * T
+CULL_MARGIN = 4 * T
+
 class Level:
-    def __init__(self, world, stage, data):
+    def __init__(self, world, stage, blob):
         self.world, self.stage = world, stage
-        self.width = len(data[0]) if data else 0
-        self.tiles, self.enemies, self.items, self.particles = [], [], [], []
+        self.tilemap = bytearray()  # column-major tile codes for columns [first, cols)
+        self.first = self.cols = self.width = 0
+        self.flagpole_x = self.castle_x = 0
+        self.blocks = {}  # (col, row) -> Tile for stateful blocks
+        self.active_blocks = []  # blocks mid-bump; the only ones ticked per frame
+        self.question_blocks = []  # blink every frame, so never baked until used
+        self.chunks = {}  # chunk index -> baked Surface of static tiles
+        self.cell_tests = 0  # grid cells examined by move_x/move_y
+        self.enemies, self.items = [], []
+        self.particles = ParticlePool()
+        self.spawns = []  # dormant enemies, nearest last
         self.camera = 0
         self.score, self.coins = 0, 0
         self.time = 400 if stage != 4 else 300
         self.underground = (world, stage) in [(1,2),(4,2)]
         self.underwater = (world, stage) in [(2,2),(7,2)]
         self.castle = stage == 4
-        self.flagpole_x, self.castle_x, self.flag_y = 0, 0, 0
-        self.parse_level(data)
-    
-    def parse_level(self, data):
-        for row_idx, row in enumerate(data):
-            for col_idx, char in enumerate(row):
-                x, y = col_idx * T, row_idx * T
-                tile = None
-                if char == '#': tile = Tile(x, y, "ground")
-                elif char == 'B': tile = Tile(x, y, "brick")
-                elif char == '?':
-                    tile = Tile(x, y, "question")
-                    tile.contents = "coin"
-                elif char == 'M':
-                    tile = Tile(x, y, "question")
-                    tile.contents = "mushroom"
-                elif char == 'S':
-                    tile = Tile(x, y, "question")
-                    tile.contents = "star"
-                elif char == '1':
-                    tile = Tile(x, y, "brick")
-                    tile.contents = "1up"
-                elif char == 'C':
-                    tile = Tile(x, y, "brick")
-                    tile.contents = "multi_coin"
-                    tile.coin_count = 10
-                elif char == 'H': tile = Tile(x, y, "hard")
-                elif char == '[': tile = Tile(x, y, "pipe_tl")
-                elif char == ']': tile = Tile(x, y, "pipe_tr")
-                elif char == '{': tile = Tile(x, y, "pipe_l")
-                elif char == '}': tile = Tile(x, y, "pipe_r")
-                elif char == 'o': self.items.append(Coin(x, y))
-                elif char == 'g': self.enemies.append(Goomba(x, y))
-                elif char == 'k': self.enemies.append(Koopa(x, y))
-                elif char == 'r': self.enemies.append(Koopa(x, y, red=True))
-                elif char == 'w': self.enemies.append(Koopa(x, y, winged=True))
-                elif char == 'p': self.enemies.append(PiranhaPlant(x, y - 8))
-                elif char == 'P': self.flagpole_x = x
-                elif char == 'K': self.castle_x = x
-                if tile: self.tiles.append(tile)
-    
-    def get_nearby_tiles(self, x, y):
+        self.flag_y = 0
+        self.load(blob)
+    
+    def load(self, blob):
+        """Append the tile grid, blocks and spawns of a compile_level blob after
+        the last loaded column. A stage is a single blob; EndlessLevel streams."""
+        magic, version, width, cols, self.height, flagpole_x, castle_x, nblocks, nspawns = \
+            LEVEL_HEADER.unpack_from(blob)
+        if magic != LEVEL_MAGIC or version != LEVEL_VERSION:
+            raise ValueError(f"not a version {LEVEL_VERSION} level")
+        at = self.cols
+        self.width, self.cols = at + width, at + cols
+        if flagpole_x: self.flagpole_x = at * T + flagpole_x
+        if castle_x: self.castle_x = at * T + castle_x
+        offset = LEVEL_HEADER.size + cols * self.height
+        self.tilemap += blob[LEVEL_HEADER.size:offset]
+        for col, row, contents in LEVEL_BLOCK.iter_unpack(blob[offset:offset + nblocks * LEVEL_BLOCK.size]):
+            col += at
+            block = self.blocks[(col, row)] = Tile(col, row, BLOCK_CONTENTS[contents])
+            if block.contents == "multi_coin": block.coin_count = 10
+            if self.tile_type(col, row) == "question": self.question_blocks.append(block)
+        offset += nblocks * LEVEL_BLOCK.size
+        spawns = []
+        for char, col, row in LEVEL_SPAWN.iter_unpack(blob[offset:offset + nspawns * LEVEL_SPAWN.size]):
+            entity = SPAWNERS[char]((at + col) * T, row * T)
+            (self.items if char == b'o' else spawns).append(entity)
+        # Everything appended lies past the dormant enemies already queued
+        spawns.sort(key=lambda enemy: enemy.x)
+        spawns.reverse()
+        self.spawns[:0] = spawns
+    
+    def wake_enemies(self):
+        """Bring dormant enemies within ACTIVATE_MARGIN of the screen into play."""
+        edge = self.camera + NES_W + ACTIVATE_MARGIN
+        spawns = self.spawns
+        while spawns and spawns[-1].x < edge:
+            self.enemies.append(spawns.pop())
+    
+    def tile_type(self, col, row):
+        if self.first <= col < self.cols and 0 <= row < self.height:
+            return TILE_TYPES[self.tilemap[(col - self.first) * self.height + row]]
+        return "empty"
+    
+    def set_tile(self, col, row, kind):
+        self.tilemap[(col - self.first) * self.height + row] = TILE_CODE[kind]
+        self.invalidate_tile(col, row)
+    
+    def is_solid(self, col, row):
+        return (self.first <= col < self.cols and 0 <= row < self.height
+                and TILE_SOLID[self.tilemap[(col - self.first) * self.height + row]] == 1)
+    
+    def overlaps(self, x, y, w, h):
+        """Whether the box (x, y, w, h) covers any solid cell."""
+        return any(self.is_solid(col, row)
+                   for col in range(math.floor(x / T), math.ceil((x + w) / T))
+                   for row in range(math.floor(y / T), math.ceil((y + h) / T)))
+    
+    def get_nearby_solids(self, x, y):
+        """Rects of solid cells around (x, y), in row-major order.
+        
+        This was the per-entity collision query before Level.move; bench.py
+        collision still replays it as the reference path.
+        """
         tx, ty = int(x // T), int(y // T)
-        return [t for t in self.tiles if abs(t.x // T - tx) <= 2 and abs(t.y // T - ty) <= 3]
+        tilemap, h, first = self.tilemap, self.height, self.first
+        cols = range(max(tx - 2, first), min(tx + 3, self.cols))
+        return [pygame.Rect(col * T, row * T, T, T)
+                for row in range(max(ty - 3, 0), min(ty + 4, h)) for col in cols
+                if TILE_SOLID[tilemap[(col - first) * h + row]]]
+    
+    def move_x(self, x, y, w, h, dx):
+        """Sweep the box (x, y, w, h) dx pixels along X through the columns its
+        leading edge crosses. Returns the new x and the blocking column or None."""
+        if dx == 0: return x, None
+        tilemap, height, first = self.tilemap, self.height, self.first
+        rows = range(max(math.floor(y / T), 0), min(math.ceil((y + h) / T), height))
+        if dx > 0:
+            cols = range(math.ceil((x + w) / T), math.ceil((x + w + dx) / T))
+        else:
+            cols = range(math.floor(x / T) - 1, math.floor((x + dx) / T) - 1, -1)
+        for col in cols:
+            if not first <= col < self.cols: continue
+            self.cell_tests += len(rows)
+            base = (col - first) * height
+            for row in rows:
+                if TILE_SOLID[tilemap[base + row]]:
+                    return (col * T - w if dx > 0 else (col + 1) * T), col
+        return x + dx, None
+    
+    def move_y(self, x, y, w, h, dy):
+        """Sweep the box dy pixels along Y; the vertical twin of move_x."""
+        if dy == 0: return y, None
+        tilemap, height, first = self.tilemap, self.height, self.first
+        cols = range(max(math.floor(x / T), first), min(math.ceil((x + w) / T), self.cols))
+        if dy > 0:
+            rows = range(math.ceil((y + h) / T), math.ceil((y + h + dy) / T))
+        else:
+            rows = range(math.floor(y / T) - 1, math.floor((y + dy) / T) - 1, -1)
+        for row in rows:
+            if not 0 <= row < height: continue
+            self.cell_tests += len(cols)
+            for col in cols:
+                if TILE_SOLID[tilemap[(col - first) * height + row]]:
+                    return (row * T - h if dy > 0 else (row + 1) * T), row
+        return y + dy, None
+    
+    def move(self, x, y, w, h, dx, dy):
+        """Move a box by (dx, dy), X axis first, stopping at solid cells.
+        
+        Only the cells the box sweeps through are tested, so nothing is
+        skipped at high speed. Returns (x, y, hit_col, hit_row) where the
+        hits are the blocking column/row or None.
+        """
+        x, hit_col = self.move_x(x, y, w, h, dx)
+        y, hit_row = self.move_y(x, y, w, h, dy)
+        return x, y, hit_col, hit_row
+    
+    def is_static(self, col, row):
+        block = self.blocks.get((col, row))
+        if block is None: return True
+        return block.bump_offset == 0 and (block.used or self.tile_type(col, row) != "question")
+    
+    def bake_chunk(self, index):
+        chunk = pygame.Surface((CHUNK_W, self.height * T))
+        chunk.fill(LAYER_KEY)
+        chunk.set_colorkey(LAYER_KEY)
+        for col in range(index * CHUNK_COLS, min((index + 1) * CHUNK_COLS, self.cols)):
+            for row in range(self.height):
+                self.paint_cell(chunk, col, row)
+        self.chunks[index] = chunk
+        return chunk
+    
+    def paint_cell(self, chunk, col, row):
+        code = self.tilemap[(col - self.first) * self.height + row]
+        if code and self.is_static(col, row):
+            block = self.blocks.get((col, row))
+            draw_tile(chunk, TILE_TYPES[code], col % CHUNK_COLS * T, row * T, 0,
+                      self.underground, block is not None and block.used)
+    
+    def invalidate_tile(self, col, row):
+        """Repaint one cell of the baked layer after its type or state changed."""
+        chunk = self.chunks.get(col // CHUNK_COLS)
+        if chunk is not None:
+            chunk.fill(LAYER_KEY, (col % CHUNK_COLS * T, row * T, T, T))
+            self.paint_cell(chunk, col, row)
+    
+    def bump_tile(self, col, row, player):
+        block = self.blocks.get((col, row))
+        if block is None:
+            if self.tile_type(col, row) not in ("brick", "question"): return
+            block = self.blocks[(col, row)] = Tile(col, row)
+        block.bump(self, player)
     
     def update(self, player):
-        for tile in self.tiles: tile.update()
-        for enemy in self.enemies[:]:
+        t = PROFILER.clock()
+        for block in self.active_blocks[:]: block.update(self)
+        t = PROFILER.lap("level.tiles", t)
+        self.wake_enemies()
+        behind = self.camera - CULL_MARGIN
+        # Compact survivors to the front in place: no copy, no O(n) removes
+        enemies, live = self.enemies, 0
+        for enemy in enemies:
             enemy.update(self)
-            if not enemy.alive:
-                self.enemies.remove(enemy)
-            elif player and not player.dead:
+            if enemy.alive and enemy.x + enemy.w >= behind:
+                enemies[live] = enemy
+                live += 1
+        del enemies[live:]
+        # Updates never read the player, so pairs can be tested after all of
+        # them have moved; candidates come back in list order, as before.
+        enemies = SpatialHash(self.enemies) if player else None
+        if player and not player.dead:
+            for enemy in enemies.query(player.rect):
+                if player.dead: break
                 if player.rect.colliderect(enemy.rect):
                     if player.star_power > 0:
                         enemy.alive = False
@@ -1178,32 +2068,48 @@ class Level:
                         self.score += 100
                     else:
                         player.hurt()
-        for item in self.items[:]:
+        t = PROFILER.lap("level.enemies", t)
+        items, live = self.items, 0
+        for item in items:
             item.update(self)
-            if not item.alive:
-                self.items.remove(item)
-            elif player and not player.dead and not getattr(item, 'from_block', False):
-                if player.rect.colliderect(item.rect):
+            if item.alive:
+                items[live] = item
+                live += 1
+            else:
+                recycle(item)
+        del items[live:]
+        if player and not player.dead:
+            # Power-ups only ever grow the player vertically, so the columns
+            # queried up front still cover every item it can touch.
+            for item in SpatialHash(self.items).query(player.rect):
+                if player.dead: break
+                if not getattr(item, 'from_block', False) and player.rect.colliderect(item.rect):
                     result = player.power_up(item)
                     if result == "1up": pass
                     self.score += 1000
                     item.alive = False
-        for p in self.particles[:]:
-            p.update(self)
-            if not p.alive: self.particles.remove(p)
+        t = PROFILER.lap("level.items", t)
+        self.particles.update()
+        t = PROFILER.lap("level.particles", t)
         if player and not player.dead:
             target = player.x - NES_W // 3
             self.camera = max(self.camera, min(target, self.width * T - NES_W))
             self.camera = max(0, self.camera)
-        if player:
-            for fb in player.fireballs[:]:
-                for enemy in self.enemies:
+        if player and player.fireballs:
+            fireballs, live = player.fireballs, 0
+            for fb in fireballs:
+                for enemy in enemies.query(fb.rect):
                     if fb.rect.colliderect(enemy.rect) and not isinstance(enemy, PiranhaPlant):
                         enemy.alive = False
                         fb.alive = False
                         self.score += 100
                         play_sfx("kick")
                         break
+                if fb.alive:
+                    fireballs[live] = fb
+                    live += 1
+            del fireballs[live:]
+        PROFILER.lap("level.fireballs", t)
     
     def draw(self, surf, frame):
         if self.underground or self.castle: surf.fill(Pal.UNDERGROUND)
@@ -1219,26 +2125,82 @@ class Level:
             for i in range(8):
                 bx = (i * 200 - int(self.camera * 0.7)) % (NES_W + 300) - 50
                 draw_bush(surf, bx, NES_H - 48)
-        for tile in self.tiles:
-            if -T <= tile.x - self.camera <= NES_W + T:
-                tile.draw(surf, self.camera, frame, self.underground)
+        # Static tiles: one blit per visible chunk
+        scroll = math.ceil(self.camera)
+        last = min((self.cols - 1) // CHUNK_COLS, (scroll + NES_W) // CHUNK_W)
+        for index in range(max(0, scroll // CHUNK_W), last + 1):
+            chunk = self.chunks.get(index) or self.bake_chunk(index)
+            surf.blit(chunk, (index * CHUNK_W - scroll, 0))
+        # Dynamic tiles on top, column-major so bumped blocks overlap like before
+        dynamic = [b for b in self.question_blocks if not b.used and -T <= b.x - scroll <= NES_W]
+        dynamic += self.active_blocks
+        for block in sorted(dynamic, key=lambda b: (b.col, b.row)):
+            draw_tile(surf, self.tile_type(block.col, block.row), block.x - scroll,
+                      block.y - block.bump_offset, frame, self.underground, block.used)
         if self.flagpole_x > 0: draw_flagpole(surf, int(self.flagpole_x - self.camera), NES_H - 176, self.flag_y)
         if self.castle_x > 0: draw_castle(surf, int(self.castle_x - self.camera), NES_H - 128)
         for item in self.items: item.draw(surf, self.camera)
         for enemy in self.enemies: enemy.draw(surf, self.camera)
-        for p in self.particles: p.draw(surf, self.camera)
+        self.particles.draw(surf, self.camera)
 
 # === HUD ===
+FONTS = {}
+TEXT_CACHE = {}
+
+def get_font(size):
+    if size not in FONTS: FONTS[size] = pygame.font.Font(None, size)
+    return FONTS[size]
+
+def render_text(text, size=16):
+    """White text surface, rendered once per (text, size)."""
+    key = (text, size)
+    if key not in TEXT_CACHE: TEXT_CACHE[key] = get_font(size).render(text, True, Pal.WHITE)
+    return TEXT_CACHE[key]
+
+class HudRenderer:
+    """Status bar drawn from cached labels and a digit glyph atlas.
+    
+    Numeric fields are composed from glyphs and only rebuilt when the text
+    they show changes.
+    """
+    GLYPHS = "0123456789x- "
+    
+    def __init__(self):
+        self.glyphs = {ch: render_text(ch) for ch in self.GLYPHS}
+        self.fields = {}  # position -> (text, surface)
+    
+    def compose(self, text):
+        glyphs = [self.glyphs[ch] for ch in text]
+        out = pygame.Surface((sum(g.get_width() for g in glyphs), max(g.get_height() for g in glyphs)), pygame.SRCALPHA)
+        x = 0
+        for g in glyphs:
+            # Glyphs don't overlap, so MAX onto a clear surface copies them exactly
+            out.blit(g, (x, 0), special_flags=pygame.BLEND_RGBA_MAX)
+            x += g.get_width()
+        return out
+    
+    def field(self, surf, pos, text):
+        cached = self.fields.get(pos)
+        if cached is None or cached[0] != text:
+            cached = self.fields[pos] = (text, self.compose(text))
+        surf.blit(cached[1], pos)
+    
+    def draw(self, surf, score, coins, world, stage, time, lives):
+        surf.blit(render_text("MARIO"), (16, 8))
+        self.field(surf, (16, 18), f"{score:06d}")
+        draw_coin(surf, 80, 14, pygame.time.get_ticks() // 100)
+        self.field(surf, (96, 18), f"x{coins:02d}")
+        surf.blit(render_text("WORLD"), (140, 8))
+        self.field(surf, (140, 18), f" {world}-{stage}")
+        surf.blit(render_text("TIME"), (200, 8))
+        self.field(surf, (200, 18), f" {int(max(0, time)):03d}")
+
+hud = None
+
 def draw_hud(surf, score, coins, world, stage, time, lives):
-    font = pygame.font.Font(None, 16)
-    surf.blit(font.render("MARIO", True, Pal.WHITE), (16, 8))
-    surf.blit(font.render(f"{score:06d}", True, Pal.WHITE), (16, 18))
-    draw_coin(surf, 80, 14, pygame.time.get_ticks() // 100)
-    surf.blit(font.render(f"x{coins:02d}", True, Pal.WHITE), (96, 18))
-    surf.blit(font.render("WORLD", True, Pal.WHITE), (140, 8))
-    surf.blit(font.render(f" {world}-{stage}", True, Pal.WHITE), (140, 18))
-    surf.blit(font.render("TIME", True, Pal.WHITE), (200, 8))
-    surf.blit(font.render(f" {int(max(0, time)):03d}", True, Pal.WHITE), (200, 18))
+    global hud
+    if hud is None: hud = HudRenderer()
+    hud.draw(surf, score, coins, world, stage, time, lives)
 
 # === LEVEL DATA (ALL 32 LEVELS WITH PROPER PIPE HEIGHTS) ===
 LEVEL_DATA = {}
@@ -1322,81 +2284,81 @@ LEVEL_DATA[(1,4)] = [
 # Generate remaining levels (2-1 through 8-4) with SHORT 2-tile pipes
 def generate_level(world, stage):
     width = 150 + world * 15 + stage * 8
-    rows = [" " * width for _ in range(15)]
+    rows = [bytearray(b" " * width) for _ in range(15)]
     
     if stage == 4:  # Castle
-        rows[0] = "H" * width
-        rows[13] = "H" * width
-        rows[14] = "H" * width
+        rows[0] = bytearray(b"H" * width)
+        rows[13] = bytearray(b"H" * width)
+        rows[14] = bytearray(b"H" * width)
         for i in range(1, 13):
-            rows[i] = "H" + " " * (width - 2) + "H"
+            rows[i] = bytearray(b"H" + b" " * (width - 2) + b"H")
         for x in range(20, width - 40, 25):
             for i in range(5):
                 if x + i < width - 1:
-                    rows[7] = rows[7][:x+i] + "H" + rows[7][x+i+1:]
+                    rows[7][x+i] = ord("H")
         for x in range(30, width - 50, 40):
-            rows[13] = rows[13][:x] + "   " + rows[13][x+3:]
-            rows[14] = rows[14][:x] + "   " + rows[14][x+3:]
-        rows[8] = rows[8][:width-15] + "K" + rows[8][width-14:]
+            rows[13][x:x+3] = b"   "
+            rows[14][x:x+3] = b"   "
+        rows[8][width-15] = ord("K")
     elif stage == 2 and world % 2 == 0:  # Underground
-        rows[0] = "B" * width
-        rows[13] = "B" * width
-        rows[14] = "B" * width
+        rows[0] = bytearray(b"B" * width)
+        rows[13] = bytearray(b"B" * width)
+        rows[14] = bytearray(b"B" * width)
         for i in range(1, 13):
-            rows[i] = "B" + " " * (width - 2) + "B"
+            rows[i] = bytearray(b"B" + b" " * (width - 2) + b"B")
         for x in range(15, width - 30, 22):
-            rows[8] = rows[8][:x] + "BB?BB" + rows[8][x+5:]
+            rows[8][x:x+5] = b"BB?BB"
         # SHORT pipes (2 tiles) - Mario can easily jump over
         for x in range(30, width - 45, 35):
-            rows[11] = rows[11][:x] + "[]" + rows[11][x+2:]
-            rows[12] = rows[12][:x] + "{}" + rows[12][x+2:]
+            rows[11][x:x+2] = b"[]"
+            rows[12][x:x+2] = b"{}"
         for x in range(20, width - 30, 28):
-            rows[12] = rows[12][:x] + "g" + rows[12][x+1:]
-        rows[8] = rows[8][:width-14] + "P    K" + rows[8][width-8:]
+            rows[12][x] = ord("g")
+        rows[8][width-14:width-8] = b"P    K"
     elif (world, stage) in [(2,2), (7,2)]:  # Underwater
-        rows[13] = "#" * width
-        rows[14] = "#" * width
+        rows[13] = bytearray(b"#" * width)
+        rows[14] = bytearray(b"#" * width)
         for x in range(18, width - 30, 28):
             for i in range(5):
                 if x + i < width:
-                    rows[9] = rows[9][:x+i] + "H" + rows[9][x+i+1:]
+                    rows[9][x+i] = ord("H")
         for x in range(22, width - 40, 22):
-            rows[4] = rows[4][:x] + "ooo" + rows[4][x+3:]
-        rows[8] = rows[8][:width-14] + "P    K" + rows[8][width-8:]
+            rows[4][x:x+3] = b"ooo"
+        rows[8][width-14:width-8] = b"P    K"
     elif stage == 3:  # Athletic
-        rows[13] = "#" * width
-        rows[14] = "#" * width
+        rows[13] = bytearray(b"#" * width)
+        rows[14] = bytearray(b"#" * width)
         for x in range(15, width - 35, 18):
             for i in range(3 + x % 2):
                 if x + i < width:
-                    rows[9 - (x % 3)] = rows[9 - (x % 3)][:x+i] + "H" + rows[9 - (x % 3)][x+i+1:]
+                    rows[9 - (x % 3)][x+i] = ord("H")
         for x in range(25, width - 40, 25):
-            rows[5] = rows[5][:x] + "ooo" + rows[5][x+3:]
+            rows[5][x:x+3] = b"ooo"
         for x in range(30, width - 50, 30):
             enemy = "r" if x % 2 == 0 else "w"
-            rows[9] = rows[9][:x] + enemy + rows[9][x+1:]
-        rows[8] = rows[8][:width-14] + "P    K" + rows[8][width-8:]
+            rows[9][x] = ord(enemy)
+        rows[8][width-14:width-8] = b"P    K"
     else:  # Overworld
-        rows[13] = "#" * width
-        rows[14] = "#" * width
+        rows[13] = bytearray(b"#" * width)
+        rows[14] = bytearray(b"#" * width)
         for x in range(18, width - 40, 28):
-            rows[8] = rows[8][:x] + "?B?M?" + rows[8][x+5:]
+            rows[8][x:x+5] = b"?B?M?"
         # SHORT pipes (2 tiles high) - Mario can easily jump over
         for x in range(35, width - 55, 40):
-            rows[11] = rows[11][:x] + "[]" + rows[11][x+2:]
-            rows[12] = rows[12][:x] + "{}" + rows[12][x+2:]
+            rows[11][x:x+2] = b"[]"
+            rows[12][x:x+2] = b"{}"
         # Stairs at end
         for i in range(8):
             for j in range(i + 1):
                 if width - 35 + i < width and 12 - j >= 0:
-                    rows[12-j] = rows[12-j][:width-35+i] + "H" + rows[12-j][width-34+i:]
+                    rows[12-j][width-35+i] = ord("H")
         # Enemies
         for x in range(28, width - 45, 22):
             enemy = "g" if x % 2 == 0 else "k"
-            rows[12] = rows[12][:x] + enemy + rows[12][x+1:]
-        rows[8] = rows[8][:width-14] + "P    K" + rows[8][width-8:]
+            rows[12][x] = ord(enemy)
+        rows[8][width-14:width-8] = b"P    K"
     
-    return rows
+    return [row.decode() for row in rows]
 
 # Generate all remaining levels
 for w in range(1, 9):
@@ -1404,6 +2366,128 @@ for w in range(1, 9):
         if (w, s) not in LEVEL_DATA:
             LEVEL_DATA[(w, s)] = generate_level(w, s)
 
+# === ENDLESS ===
+# Endless mode generates SEGMENT_COLS-wide segments on demand, keeping
+# STREAM_AHEAD columns past the screen loaded, and drops whole chunks once
+# they are STREAM_BEHIND columns behind the camera. The tile window, block
+# table, baked chunks and dormant spawns stay the same size however far the
+# player runs, and each segment streamed in refills the timer.
+SEGMENT_COLS = 2 * CHUNK_COLS
+STREAM_AHEAD = SEGMENT_COLS
+STREAM_BEHIND = CHUNK_COLS
+
+def endless_segment(seed, index):
+    """Rows for the index-th segment of the endless run started from seed."""
+    rng = random.Random(f"{seed}:{index}")
+    width = SEGMENT_COLS
+    rows = [bytearray(b" " * width) for _ in range(15)]
+    rows[13] = bytearray(b"#" * width)
+    rows[14] = bytearray(b"#" * width)
+    x = 20 if index == 0 else rng.randrange(2, 8)  # a clear runway to start on
+    while x < width - 6:
+        feature = rng.randrange(5)
+        if feature == 0:  # Pit
+            gap = rng.randrange(2, 4)
+            rows[13][x:x+gap] = rows[14][x:x+gap] = b" " * gap
+        elif feature == 1:  # Blocks, coin or power-up
+            rows[8][x:x+4] = b"B?" + rng.choice((b"?B", b"MB", b"BC"))
+        elif feature == 2:  # SHORT pipe
+            rows[11][x:x+2] = b"[]"
+            rows[12][x:x+2] = b"{}"
+        elif feature == 3:  # Stairs
+            for i in range(rng.randrange(2, 5)):
+                for j in range(i + 1):
+                    rows[12-j][x+i] = ord("H")
+        else:  # Enemy under a row of coins
+            rows[12][x] = ord(rng.choice("ggk"))
+            rows[9][x:x+3] = b"ooo"
+        x += rng.randrange(6, 11)
+    return [row.decode() for row in rows]
+
+class EndlessLevel(Level):
+    def __init__(self, seed=0):
+        self.seed, self.segments = seed, 0
+        super().__init__(1, 1, compile_level(endless_segment(seed, 0)))
+        self.segments = 1
+        self.stream()
+    
+    def stream(self):
+        """Generate segments up to STREAM_AHEAD columns past the screen and
+        evict every chunk wholly STREAM_BEHIND columns behind the camera."""
+        ahead = (int(self.camera) + NES_W) // T + STREAM_AHEAD
+        while self.cols < ahead:
+            self.load(compile_level(endless_segment(self.seed, self.segments)))
+            self.segments += 1
+            self.time = 400
+        behind = int(self.camera) // T - STREAM_BEHIND
+        behind -= behind % CHUNK_COLS
+        if behind > self.first: self.evict(behind)
+    
+    def evict(self, col):
+        """Forget every column before col: tiles, blocks, baked chunks and items."""
+        del self.tilemap[:(col - self.first) * self.height]
+        for index in range(self.first // CHUNK_COLS, col // CHUNK_COLS):
+            self.chunks.pop(index, None)
+        for key in [key for key in self.blocks if key[0] < col]:
+            del self.blocks[key]
+        self.question_blocks[:] = [b for b in self.question_blocks if b.col >= col]
+        self.active_blocks[:] = [b for b in self.active_blocks if b.col >= col]
+        edge = col * T
+        items, live = self.items, 0
+        for item in items:
+            if item.x + item.w >= edge:
+                items[live] = item
+                live += 1
+            else:
+                recycle(item)
+        del items[live:]
+        self.first = col
+    
+    def update(self, player):
+        t = PROFILER.clock()
+        self.stream()
+        PROFILER.lap("level.stream", t)
+        super().update(player)
+
+# === REPLAYS ===
+# File layout: header, one button byte per frame, then one uint32 state
+# checksum per `interval` frames. The final checksum covers the last frame.
+REPLAY_MAGIC = b"SMBR"
+REPLAY_VERSION = 2
+# magic, version, interval, seed, frames, final checksum, endless flag, endless seed
+REPLAY_HEADER = struct.Struct("<4sBHIIIBi")
+CHECKSUM_INTERVAL = 60
+
+class Replay:
+    def __init__(self, seed=0, interval=CHECKSUM_INTERVAL, endless=None):
+        self.seed, self.interval = seed, interval
+        self.endless = endless  # Game's endless seed, or None for the 32 stages
+        self.frames = bytearray()
+        self.checksums = []
+        self.final_checksum = 0
+    
+    def save(self, path):
+        with open(path, "wb") as f:
+            f.write(REPLAY_HEADER.pack(REPLAY_MAGIC, REPLAY_VERSION, self.interval, self.seed,
+                                       len(self.frames), self.final_checksum,
+                                       self.endless is not None, self.endless or 0))
+            f.write(self.frames)
+            f.write(struct.pack(f"<{len(self.checksums)}I", *self.checksums))
+    
+    @classmethod
+    def load(cls, path):
+        with open(path, "rb") as f: data = f.read()
+        magic, version, interval, seed, count, final, endless, endless_seed = REPLAY_HEADER.unpack_from(data)
+        if magic != REPLAY_MAGIC or version != REPLAY_VERSION:
+            raise ValueError(f"{path}: not a version {REPLAY_VERSION} replay")
+        replay = cls(seed, interval, endless_seed if endless else None)
+        start = REPLAY_HEADER.size
+        replay.frames = bytearray(data[start:start + count])
+        tail = data[start + count:]
+        replay.checksums = list(struct.unpack(f"<{len(tail) // 4}I", tail))
+        replay.final_checksum = final
+        return replay
+
 # === GAME STATES ===
 class GameState:
     TITLE = 0
@@ -1415,7 +2499,9 @@ class GameState:
 
 # === MAIN GAME ===
 class Game:
-    def __init__(self):
+    def __init__(self, input_source=read_keyboard, endless=None):
+        self.input_source = input_source
+        self.endless = endless  # seed of an endless run, or None for the 32 stages
         self.state = GameState.TITLE
         self.world, self.stage = 1, 1
         self.lives = 3
@@ -1425,10 +2511,13 @@ class Game:
         self.title_blink = 0
         self._pause_pressed = False
         self.hurry_played = False
+        self.replay = None
+        self.desyncs = []
+        self.prev_view = None  # view_state() before the latest step, for interpolation
     
     def start_level(self):
-        data = LEVEL_DATA.get((self.world, self.stage), LEVEL_DATA[(1, 1)])
-        self.level = Level(self.world, self.stage, data)
+        if self.endless is not None: self.level = EndlessLevel(self.endless)
+        else: self.level = Level(self.world, self.stage, level_blob(self.world, self.stage))
         self.player = Player(32, NES_H - 64)
         self.state = GameState.PLAYING
         self.hurry_played = False
@@ -1436,15 +2525,17 @@ class Game:
     
     def update(self):
         self.frame += 1
-        keys = pygame.key.get_pressed()
+        buttons = self.input_source()
         
         if self.state == GameState.TITLE:
             self.title_blink += 1
-            if keys[pygame.K_RETURN] or keys[pygame.K_SPACE] or keys[pygame.K_z]:
+            if buttons & (Buttons.START | Buttons.JUMP):
                 self.start_level()
         
         elif self.state == GameState.PLAYING:
-            self.player.update(keys, self.level)
+            t = PROFILER.clock()
+            self.player.update(buttons, self.level)
+            PROFILER.lap("player", t)
             self.level.update(self.player)
             self.score += self.level.score
             self.level.score = 0
@@ -1461,7 +2552,7 @@ class Game:
                 play_sfx("warning")
                 self.hurry_played = True
                 if self.player.star_power <= 0:
-                    play_music("hurry")
+                    SEQUENCER.set_tempo(HURRY_TEMPO)
             if self.level.flagpole_x > 0 and self.player.x >= self.level.flagpole_x - 8 and not self.player.win:
                 self.player.win = True
                 self.state = GameState.LEVEL_COMPLETE
@@ -1475,7 +2566,7 @@ class Game:
             if self.player.dead and self.player.y > NES_H + 32:
                 self.state = GameState.DYING
                 self.timer = 0
-            if keys[pygame.K_RETURN] or keys[pygame.K_ESCAPE]:
+            if buttons & Buttons.START:
                 if not self._pause_pressed:
                     self.state = GameState.PAUSED
                     self._pause_pressed = True
@@ -1520,63 +2611,206 @@ class Game:
                 self.world, self.stage = 1, 1
         
         elif self.state == GameState.PAUSED:
-            if keys[pygame.K_RETURN] or keys[pygame.K_ESCAPE]:
+            if buttons & Buttons.START:
                 if not self._pause_pressed:
                     self.state = GameState.PLAYING
                     self._pause_pressed = True
             else:
                 self._pause_pressed = False
     
-    def draw(self):
+    def view_state(self):
+        """What interpolated rendering blends between: camera and player position."""
+        if self.level is None: return None
+        return self.level, self.level.camera, self.player.x, self.player.y
+    
+    def draw(self, alpha=1.0):
+        """Render the current state, blended alpha of the way from the previous step.
+        
+        Only the camera and player are interpolated; enemies move at most a
+        pixel or two per step and are drawn where the simulation left them.
+        """
         nes_surface.fill(Pal.SKY)
         
         if self.state == GameState.TITLE:
             nes_surface.fill(Pal.SKY)
-            font_big = pygame.font.Font(None, 24)
-            font_small = pygame.font.Font(None, 16)
-            title = font_big.render("SUPER MARIO BROS.", True, Pal.WHITE)
+            title = render_text("SUPER MARIO BROS.", 24)
             nes_surface.blit(title, (NES_W//2 - title.get_width()//2, 50))
             draw_mario(nes_surface, NES_W//2 - 8, 90, 1, self.frame//8, True, False, False)
             if (self.title_blink // 30) % 2 == 0:
-                start = font_small.render("PRESS ENTER TO START", True, Pal.WHITE)
+                start = render_text("PRESS ENTER TO START")
                 nes_surface.blit(start, (NES_W//2 - start.get_width()//2, 150))
-            copy = font_small.render("Cat's Ultra Mario 2D Bros!", True, Pal.WHITE)
+            copy = render_text("Cat's Ultra Mario 2D Bros!")
             nes_surface.blit(copy, (NES_W//2 - copy.get_width()//2, 190))
-            copy2 = font_small.render("Team Flames 2025", True, Pal.WHITE)
+            copy2 = render_text("Team Flames 2025")
             nes_surface.blit(copy2, (NES_W//2 - copy2.get_width()//2, 205))
         
         elif self.state in [GameState.PLAYING, GameState.DYING, GameState.LEVEL_COMPLETE, GameState.PAUSED]:
-            self.level.draw(nes_surface, self.frame)
-            self.player.draw(nes_surface, self.level.camera, self.frame)
+            t = PROFILER.clock()
+            level, player = self.level, self.player
+            camera, x, y = level.camera, player.x, player.y
+            prev = self.prev_view
+            if alpha < 1 and prev and prev[0] is level:
+                level.camera = prev[1] + (camera - prev[1]) * alpha
+                player.x, player.y = prev[2] + (x - prev[2]) * alpha, prev[3] + (y - prev[3]) * alpha
+            level.draw(nes_surface, self.frame)
+            player.draw(nes_surface, level.camera, self.frame)
+            level.camera, player.x, player.y = camera, x, y
+            t = PROFILER.lap("level.draw", t)
             draw_hud(nes_surface, self.score, self.coins, self.world, self.stage, self.level.time, self.lives)
+            PROFILER.lap("hud", t)
             if self.state == GameState.PAUSED:
-                font = pygame.font.Font(None, 24)
-                pause = font.render("PAUSED", True, Pal.WHITE)
+                pause = render_text("PAUSED", 24)
                 nes_surface.blit(pause, (NES_W//2 - pause.get_width()//2, NES_H//2))
         
         elif self.state == GameState.GAME_OVER:
             nes_surface.fill(Pal.BLACK)
-            font = pygame.font.Font(None, 24)
-            go = font.render("GAME OVER", True, Pal.WHITE)
+            go = render_text("GAME OVER", 24)
             nes_surface.blit(go, (NES_W//2 - go.get_width()//2, NES_H//2))
         
-        pygame.transform.scale(nes_surface, (W, H), screen)
-        pygame.display.flip()
+        DRAW_COUNTER.end_frame()
+        if SCALER.screen is None: return
+        SCALER.present(nes_surface, static=self.state in (GameState.TITLE, GameState.PAUSED, GameState.GAME_OVER))
     
-    def run(self):
+    def run(self, uncapped=False):
+        """Simulate in fixed STEPs of wall time, rendering once per loop.
+        
+        Elapsed time feeds an accumulator that is drained one update() per
+        STEP, so a slow render skips frames instead of slowing the game; past
+        MAX_CATCHUP steps the backlog is dropped. Renders blend between the
+        last two steps, which keeps motion smooth when uncapped.
+        """
         running = True
+        lag, previous = 0.0, time.perf_counter()
         while running:
             for event in pygame.event.get():
                 if event.type == pygame.QUIT:
                     running = False
-            self.update()
-            self.draw()
-            clock.tick(FPS)
+                elif event.type == pygame.KEYDOWN and event.key == pygame.K_F3:
+                    PROFILER.overlay = not PROFILER.overlay
+            now = time.perf_counter()
+            lag += now - previous
+            previous = now
+            t = PROFILER.clock()
+            steps = 0
+            while lag >= STEP and steps < MAX_CATCHUP:
+                self.prev_view = self.view_state()
+                self.update()
+                lag -= STEP
+                steps += 1
+            if lag >= STEP:
+                PROFILER.count("dropped steps", int(lag // STEP))
+                lag %= STEP
+            SEQUENCER.pump()
+            if steps > 1: PROFILER.count("skipped renders", steps - 1)
+            elif steps == 0: PROFILER.count("duplicated renders")
+            PROFILER.count("steps", steps)
+            PROFILER.count("renders")
+            self.draw(lag / STEP)
+            PROFILER.lap("frame", t)
+            PROFILER.end_frame()
+            clock.tick() if uncapped else clock.tick(FPS)
         pygame.quit()
+        print(", ".join(f"{value} {name}" for name, value in sorted(PROFILER.counters.items())))
+    
+    def state_checksum(self):
+        state = [self.state, self.world, self.stage, self.lives, self.score, self.coins, self.frame, self.timer]
+        if self.level:
+            level, p = self.level, self.player
+            state += [level.time, level.camera, level.flag_y, zlib.crc32(level.tilemap),
+                      p.x, p.y, p.vx, p.vy, p.big, p.fire, p.dead, p.win, p.star_power, p.invincible]
+            state += [(type(e).__name__, e.x, e.y, e.vx, e.vy, e.alive) for e in level.enemies + level.items]
+            state += level.particles.snapshot()
+            state += [(type(e).__name__, e.x, e.y, e.vx, e.vy, e.alive) for e in p.fireballs]
+        return zlib.crc32(repr(state).encode())
+    
+    def start_recording(self, seed=0, interval=CHECKSUM_INTERVAL):
+        """Log every frame's buttons from the current input source into self.replay."""
+        random.seed(seed)
+        replay = self.replay = Replay(seed, interval, self.endless)
+        source = self.input_source
+        def record():
+            # Runs before the frame is simulated, so this checks the previous one
+            if replay.frames and len(replay.frames) % interval == 0:
+                replay.checksums.append(self.state_checksum())
+            buttons = source()
+            replay.frames.append(buttons)
+            return buttons
+        self.input_source = record
+    
+    def stop_recording(self):
+        self.replay.final_checksum = self.state_checksum()
+        return self.replay
+    
+    def start_playback(self, replay):
+        """Drive the game from replay; frames whose checksum differs go to self.desyncs."""
+        random.seed(replay.seed)
+        self.replay, self.desyncs = replay, []
+        frame = 0
+        def playback():
+            nonlocal frame
+            checkpoint = frame // replay.interval - 1
+            if frame and frame % replay.interval == 0 and checkpoint < len(replay.checksums):
+                if self.state_checksum() != replay.checksums[checkpoint]: self.desyncs.append(frame)
+            buttons = replay.frames[frame] if frame < len(replay.frames) else 0
+            frame += 1
+            return buttons
+        self.input_source = playback
+    
+    def verify_playback(self):
+        """After exactly len(replay.frames) updates: True if every checksum matched."""
+        if self.state_checksum() != self.replay.final_checksum:
+            self.desyncs.append(len(self.replay.frames))
+        return not self.desyncs
+    
+    def run_headless(self, frames):
+        """Step the simulation as fast as possible; returns frames per second."""
+        start = time.perf_counter()
+        for _ in range(frames):
+            t = PROFILER.clock()
+            self.update()
+            PROFILER.lap("frame", t)
+            PROFILER.end_frame()
+        return frames / max(time.perf_counter() - start, 1e-9)
 
 # === BOOT ===
 if __name__ == "__main__":
+    import argparse
+    import atexit
+    parser = argparse.ArgumentParser(description="Cat's Ultra Mario 2D Bros!")
+    parser.add_argument("--headless", action="store_true", help="no window or audio; step a scripted run")
+    parser.add_argument("--frames", type=int, default=36000, help="frames to simulate in headless mode")
+    parser.add_argument("--record", metavar="FILE", help="record inputs and state checksums to FILE")
+    parser.add_argument("--replay", metavar="FILE", help="play back FILE and verify its checksums")
+    parser.add_argument("--profile", metavar="FILE", help="dump per-frame section timings to FILE (.csv or .json)")
+    parser.add_argument("--uncapped", action="store_true", help="render as fast as possible, interpolating between steps")
+    parser.add_argument("--scaler", choices=SCALERS, help="how frames are scaled to the window (default: integer from 3x up)")
+    parser.add_argument("--endless", metavar="SEED", type=int, nargs="?", const=0,
+                        help="run one endless procedurally generated course instead of the 32 stages")
+    args = parser.parse_args()
+    if args.profile:
+        PROFILER.records = []
+        atexit.register(PROFILER.dump, args.profile)
     print("Cat's Ultra Mario 2D Bros! v1.1")
+    if args.scaler and not HEADLESS:
+        SCALER = Scaler(args.scaler)
+        SCALER.open()
+        nes_surface = nes_surface.convert()
+    replay = Replay.load(args.replay) if args.replay else None
+    # A replay always plays back in the mode it was recorded in
+    endless = replay.endless if replay else args.endless
+    if HEADLESS:
+        game = Game(autorun_input(), endless)
+        if replay:
+            game.start_playback(replay)
+            fps = game.run_headless(len(replay.frames))
+            ok = game.verify_playback()
+            print(f"replay {'OK' if ok else f'DESYNC at frames {game.desyncs}'} ({len(replay.frames)} frames at {fps:.0f} fps)")
+            sys.exit(0 if ok else 1)
+        if args.record: game.start_recording()
+        fps = game.run_headless(args.frames)
+        print(f"{args.frames} frames at {fps:.0f} fps, ended in {game.world}-{game.stage} with score {game.score}")
+        if args.record: game.stop_recording().save(args.record)
+        sys.exit(0)
     print("Controls: Arrows/WASD=Move, Z/Space=Jump, X/Shift=Run")
     print("Loading sounds...", end=" ", flush=True)
     init_sounds()
@@ -1584,4 +2818,9 @@ if __name__ == "__main__":
     print("Loading music...", end=" ", flush=True)
     init_music()
     print("OK")
-    Game().run() " make al the level s in smb1 1-1 8-4 ACCURTLY
+    game = Game(endless=endless)
+    if replay: game.start_playback(replay)
+    elif args.record: game.start_recording()
+    game.run(args.uncapped)
+    if args.record and not replay: game.stop_recording().save(args.record)
+    if replay: print(f"replay {'OK' if not game.desyncs else f'DESYNC at frames {game.desyncs}'}")
@@ -0,0 +1,21 @@
+"""The analyzer's state keys must tell apart every state the physics does."""
+
+import os
+import sys
+
+os.environ.setdefault("SMB1_HEADLESS", "1")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import smb1
+import analyze
+
+def test_jump_timers_have_distinct_keys():
+    player = smb1.Player(32, smb1.NES_H - 64)
+    player.jumping = player.jump_held = True
+    keys = set()
+    for on_ground in (False, True):
+        player.on_ground = on_ground
+        for timer in range(smb1.Phys.JUMP_FRAMES + 1):
+            player.jump_timer = timer
+            keys.add(analyze.state_key(player))
+    assert len(keys) == 2 * (smb1.Phys.JUMP_FRAMES + 1)
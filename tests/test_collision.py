@@ -0,0 +1,49 @@
+"""A big player under a one-tile ceiling must not end up stuck in it."""
+
+import os
+import sys
+
+os.environ.setdefault("SMB1_HEADLESS", "1")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import smb1
+
+GROUND_ROW = 13  # 1-1's floor under its first columns
+
+def low_ceiling_level():
+    """1-1 with a row of bricks one tile above the floor from column 4 on."""
+    level = smb1.Level(1, 1, smb1.level_blob(1, 1))
+    for col in range(4, 12):
+        level.set_tile(col, GROUND_ROW - 2, "brick")
+    return level
+
+def walk(player, level, buttons, frames):
+    for _ in range(frames):
+        player.update(buttons, level)
+        rect = player.rect
+        assert not level.overlaps(rect.x, rect.y, rect.w, rect.h)
+
+def test_power_up_under_ceiling_then_move():
+    level = low_ceiling_level()
+    player = smb1.Player(6 * smb1.T, (GROUND_ROW - 1) * smb1.T)
+    walk(player, level, 0, 2)
+    assert player.on_ground
+    player.power_up(smb1.Mushroom(player.x, player.y))
+    player.grow_timer = 0
+    start = player.x
+    walk(player, level, smb1.Buttons.RIGHT, 30)
+    assert player.x > start
+    walk(player, level, smb1.Buttons.RIGHT, 120)
+    assert player.x > 12 * smb1.T and not player.ducking
+
+def test_stand_up_under_ceiling_then_move():
+    level = low_ceiling_level()
+    player = smb1.Player(2 * smb1.T, (GROUND_ROW - 2) * smb1.T)
+    player.big = True
+    walk(player, level, 0, 2)
+    player.vx = smb1.Phys.RUN_MAX
+    walk(player, level, smb1.Buttons.DOWN, 20)  # slide in ducked
+    assert level.is_solid(int((player.x + 1) // smb1.T), GROUND_ROW - 2)
+    start = player.x
+    walk(player, level, smb1.Buttons.LEFT, 30)
+    assert player.x < start
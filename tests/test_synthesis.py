@@ -0,0 +1,29 @@
+"""NumPy and scalar synthesis must produce the same PCM, byte for byte."""
+
+import os
+import sys
+
+import pytest
+
+os.environ.setdefault("SMB1_HEADLESS", "1")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import smb1
+
+pytestmark = pytest.mark.skipif(smb1.np is None, reason="NumPy backend not installed")
+
+smb1.init_music()
+
+@pytest.mark.parametrize("name", sorted(smb1.SFX_DEFS))
+def test_sound_backends_match(name):
+    freq_func, duration, volume = smb1.SFX_DEFS[name]
+    scalar = smb1._render_sound_scalar(freq_func, duration, volume)
+    assert bytes(smb1._render_sound_np(freq_func, duration, volume)) == bytes(scalar)
+
+@pytest.mark.parametrize("scale", [1.0, 1.5])
+@pytest.mark.parametrize("name", sorted(smb1.MUSIC_DEFS))
+def test_music_backends_match(name, scale):
+    melody, bass, tempo, duration, duty = smb1.MUSIC_DEFS[name]
+    count = int(smb1.SAMPLE_RATE * duration / scale)
+    args = (melody, bass, tempo, duty, 0, count, 0.0, 0.0, scale)
+    assert bytes(smb1._render_music_np(*args)) == bytes(smb1._render_music_scalar(*args))